@@ -1,12 +1,22 @@
-from typing import List, Dict, Optional
-import yfinance as yf
+from typing import List, Dict, Optional, Tuple
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup as bs
 import time
-from io import StringIO
+import numpy as np
 import logging
 from dataclasses import dataclass
+from weighting import PortfolioWeighter
+from risk import portfolio_risk_report
+from results_store import ResultsStore
+from market_data import PriceMatrixCache
+import upstream
+from issuers import unique_issuers
+from profiling import PipelineProfiler
+from journal import JobJournal
+from liquidity import LiquidityFilter
+from rebalancing import Rebalancer, RebalanceResult
+from universe import UniverseProvider, SP500Universe
+from concurrency import AdaptiveExecutor, failure_reason, is_retryable
+from scheduling import TopKScheduler
 
 # Configure logging
 logging.basicConfig(
@@ -20,55 +30,29 @@ class StockScore:
     """Data class to store stock scoring information."""
     ticker: str
     score: float
-
-class SP500Scraper:
-    """Class responsible for scraping S&P 500 data."""
-    
-    def __init__(self, url: str = 'https://www.slickcharts.com/sp500'):
-        self.url = url
-        self.headers = {'User-Agent': 'Mozilla/5.0'}
-
-    def get_tickers(self) -> List[str]:
-        """Retrieve list of S&P 500 tickers from web.
-        
-        Returns:
-            List[str]: List of stock tickers
-        """
-        try:
-            request = requests.get(self.url, headers=self.headers)
-            request.raise_for_status()
-            soup = bs(request.text, "lxml")
-            stats = soup.find('table', class_='table table-hover table-borderless table-sm')
-            
-            if not stats:
-                raise ValueError("Table not found in webpage")
-            
-            df = pd.read_html(StringIO(str(stats)))[0]
-            return df['Symbol'].tolist()
-        
-        except Exception as e:
-            logger.error(f"Error fetching S&P 500 tickers: {e}")
-            return []
+    market_cap: Optional[float] = None
+    trailing_pe: Optional[float] = None
+    dividend_yield: Optional[float] = None
 
 class StockAnalyzer:
     """Class for analyzing stock metrics and calculating scores."""
 
     @staticmethod
-    def calculate_score(ticker: str, index: int, total: int) -> Optional[StockScore]:
+    def calculate_score(ticker: str, index: int, total: Optional[int] = None) -> Optional[StockScore]:
         """Calculate score for a given stock based on financial metrics.
         
         Args:
             ticker: Stock symbol
             index: Current processing index
-            total: Total number of stocks to process
+            total: Total number of stocks to process, if known
             
         Returns:
             Optional[StockScore]: Stock score if calculation successful, None otherwise
         """
-        logger.info(f"Processing {ticker} ({index + 1}/{total})")
+        logger.info(f"Processing {ticker} ({index + 1}{f'/{total}' if total else ''})")
         
         try:
-            stock = yf.Ticker(ticker)
+            stock = upstream.Ticker(ticker)
             info = stock.info
 
             metrics = {
@@ -89,18 +73,38 @@ class StockAnalyzer:
                 (metrics['dividendYield'] * 100)
             )
             
-            return StockScore(ticker=ticker, score=score)
+            return StockScore(ticker=ticker, score=score, market_cap=info.get('marketCap'),
+                              trailing_pe=metrics['trailingPE'], dividend_yield=metrics['dividendYield'])
 
         except Exception as e:
+            if is_retryable(e):
+                raise
             logger.error(f"Error processing {ticker}: {e}")
             return None
 
 class SP500Analyzer:
     """Main class for analyzing S&P 500 stocks."""
     
-    def __init__(self):
-        self.scraper = SP500Scraper()
+    def __init__(self, weighting_method: Optional[str] = None, risk_report: bool = False,
+                 results_dir: Optional[str] = 'results', profiler: Optional[PipelineProfiler] = None,
+                 run_id: Optional[str] = None, liquidity: Optional[LiquidityFilter] = None,
+                 rebalancer: Optional[Rebalancer] = None, universe: Optional[UniverseProvider] = None,
+                 executor: Optional[AdaptiveExecutor] = None, scheduler: Optional[TopKScheduler] = None):
+        self.universe = universe or SP500Universe()
         self.analyzer = StockAnalyzer()
+        self.executor = executor or AdaptiveExecutor()
+        self.weighting_method = weighting_method
+        self.weighter = PortfolioWeighter() if weighting_method else None
+        self.risk_report = risk_report
+        self.store = ResultsStore(results_dir) if results_dir else None
+        self.profiler = profiler or PipelineProfiler()
+        self.journal = JobJournal(run_id)
+        self.liquidity = liquidity
+        self.rebalancer = rebalancer
+        self.scheduler = scheduler
+        if scheduler:
+            # The whole top 10 must be settled, and with buffering held names stay down to hold_rank
+            scheduler.k = max(scheduler.k, 10, rebalancer.hold_rank if rebalancer else 0)
 
     def run_analysis(self) -> Optional[pd.DataFrame]:
         """Execute full analysis of S&P 500 stocks.
@@ -108,34 +112,140 @@ class SP500Analyzer:
         Returns:
             Optional[pd.DataFrame]: Top 10 stocks by score if successful, None otherwise
         """
+        with self.profiler.session():
+            return self._run_analysis()
+
+    def _run_analysis(self) -> Optional[pd.DataFrame]:
+        """Run the analysis stages, profiled when profiling is enabled."""
         start_time = time.time()
-        companies = self.scraper.get_tickers()
-        
+
+        # Tickers stream in from the universe, through the prefilter, straight into the fetch
+        excluded = {}
+        tickers = iter(self.universe)
+        if self.liquidity:
+            tickers = self.liquidity.stream(tickers, excluded)
+        previous = self.rebalancer.previous_weights('factor_score') if self.rebalancer else None
+        if self.scheduler:
+            # Likely leaders first, stopping once the top k cannot change
+            tickers = list(tickers)
+            required = previous.index if previous is not None else ()
+            estimates, residuals = self._score_estimates(tickers)
+            self.scheduler.plan('factor_score', tickers, required, estimates, residuals)
+            tickers = self.scheduler.pending()
+
+        def score(item):
+            index, ticker = item
+            return self.journal.run(
+                'score', ticker,
+                lambda: self.executor.call(self.analyzer.calculate_score, ticker, index, self.universe.size)
+            )
+
+        companies, scores, unscored = [], [], {}
+        with self.profiler.stage('fetch'):
+            for (_, ticker), score_result, error in self.executor.map(score, enumerate(tickers)):
+                companies.append(ticker)
+                if error:
+                    logger.warning(f"Giving up on {ticker} for this run: {error}")
+                    unscored[ticker] = failure_reason(error)
+                if score_result:
+                    scores.append({
+                        'Ticker': score_result.ticker,
+                        'Score': score_result.score,
+                        'Market_Cap': score_result.market_cap,
+                        'Trailing_PE': score_result.trailing_pe,
+                        'Dividend_Yield': score_result.dividend_yield
+                    })
+                self.profiler.check(ticker)
+                if self.scheduler:
+                    # Fetches already in flight when the top k settles are still recorded
+                    self.scheduler.observe(ticker, score_result.score if score_result else None)
+        self.executor.log_metrics()
+        if self.scheduler and self.scheduler.unfetched:
+            logger.info(f"Top {self.scheduler.k} settled after {len(companies)} of "
+                        f"{len(companies) + len(self.scheduler.unfetched)} tickers")
+            unscored.update(dict.fromkeys(self.scheduler.unfetched, 'Not refreshed (top-k settled)'))
+            companies += self.scheduler.unfetched
+        companies += list(excluded)
+        excluded.update(unscored)
+
         if not companies:
             logger.error("Failed to retrieve company list")
             return None
+        if self.liquidity:
+            self.liquidity.record_market_caps({s['Ticker']: s['Market_Cap'] for s in scores})
 
-        scores = []
-        for index, ticker in enumerate(companies):
-            score_result = self.analyzer.calculate_score(ticker, index, len(companies))
-            if score_result:
-                scores.append({
-                    'Ticker': score_result.ticker,
-                    'Score': score_result.score
-                })
-
-        if not scores:
+        with self.profiler.stage('ranking'):
+            top_10 = self._prepare_results(scores, start_time, previous) if scores else None
+        if top_10 is None:
             logger.warning("No valid scores calculated")
-            return None
+        rebalance = None
+        if self.rebalancer and top_10 is not None:
+            rebalance = self.rebalancer.rebalance(top_10['Ticker'], top_10.get('Weight'), previous)
+        if self.store:
+            self._save_run(companies, scores, top_10, excluded, rebalance)
+        return top_10
+
+    @staticmethod
+    def _reprice(runs: pd.DataFrame, ratio: pd.Series) -> pd.Series:
+        """Stored scores with the P/E and dividend-yield terms moved by a price ratio.
+
+        P/E scales with the price and dividend yield with its inverse; the other
+        metrics keep their stored value. Rows without a stored P/E and yield, or
+        without a ratio, keep their stored score.
+        """
+        repriced = (runs['score'] + 10 * runs['trailing_pe'] * (1 - ratio)
+                    + 100 * runs['dividend_yield'] * (1 / ratio - 1))
+        return repriced.fillna(runs['score'])
+
+    def _score_estimates(self, tickers: List[str]) -> Tuple[pd.Series, np.ndarray]:
+        """Last stored score of each ticker repriced to the latest cached close, and past errors.
+
+        The errors apply the same repricing to every pair of consecutive runs that
+        scored a ticker and compare the result with the later run's actual score, so
+        the scheduler's drift measures the error of these very estimates.
 
-        return self._prepare_results(scores, start_time)
+        Returns:
+            Tuple[pd.Series, np.ndarray]: Estimate by ticker, and actual minus estimate
+            of every past run pair
+        """
+        runs = self.scheduler.store.read('factor_score', tickers)
+        if runs.empty:
+            return pd.Series(dtype=float), np.empty(0)
+        runs = runs.reindex(columns=['run_date', 'run_id', 'ticker', 'score', 'trailing_pe', 'dividend_yield'])
+        runs = (runs.dropna(subset=['score']).sort_values('run_id')
+                .drop_duplicates(['run_id', 'ticker'], keep='last').reset_index(drop=True))
+
+        # Close of each ticker on each of its run dates, and its latest cached close
+        cache = self.liquidity.cache if self.liquidity else PriceMatrixCache()
+        closes = cache.prices.reindex(columns=runs['ticker'].unique()).ffill()
+        values = closes.to_numpy(dtype=float)
+        rows = closes.index.searchsorted(pd.to_datetime(runs['run_date']), side='right') - 1
+        columns = closes.columns.get_indexer(runs['ticker'])
+        if len(closes):
+            runs['close'] = np.where(rows >= 0, values[np.maximum(rows, 0), columns], np.nan)
+            latest = pd.Series(values[-1], index=closes.columns)
+        else:
+            runs['close'] = np.nan
+            latest = pd.Series(np.nan, index=closes.columns)
+
+        previous = runs.groupby('ticker')[['score', 'trailing_pe', 'dividend_yield', 'close']].shift(1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            estimated = self._reprice(previous, runs['close'] / previous['close'])
+        residuals = (runs['score'] - estimated)[previous['score'].notna()].to_numpy()
+
+        last = runs.drop_duplicates('ticker', keep='last').set_index('ticker')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            estimates = self._reprice(last, latest.reindex(last.index) / last['close'])
+        return estimates, residuals
 
-    def _prepare_results(self, scores: List[Dict], start_time: float) -> pd.DataFrame:
+    def _prepare_results(self, scores: List[Dict], start_time: float,
+                         previous: Optional[pd.Series] = None) -> pd.DataFrame:
         """Prepare and format analysis results.
         
         Args:
             scores: List of calculated stock scores
             start_time: Analysis start timestamp
+            previous: Previous portfolio weights, to apply the rebalancer's buffer rule
             
         Returns:
             pd.DataFrame: Formatted top 10 results
@@ -145,7 +255,17 @@ class SP500Analyzer:
         scores_df = scores_df.sort_values(by='Score', ascending=False).reset_index(drop=True)
         scores_df['Rank'] = scores_df.index + 1
         
-        top_10 = scores_df[['Rank', 'Ticker']].head(10)
+        ranked = unique_issuers(scores_df, 'Ticker')
+        if previous is not None:
+            ranked = ranked[ranked['Ticker'].isin(self.rebalancer.select(ranked['Ticker'], previous.index))]
+        top_10 = ranked[['Rank', 'Ticker']].head(10)
+        if self.weighter:
+            weights = self.weighter.weights(top_10['Ticker'].tolist(), self.weighting_method)
+            top_10 = top_10.assign(Weight=weights.values.round(4))
+        if self.risk_report:
+            cache = self.weighter.cache if self.weighter else None
+            report = portfolio_risk_report(top_10['Ticker'].tolist(), top_10.get('Weight'), cache)
+            logger.info(f"\nRolling 1-year risk:\n{report.round(4).to_string()}")
         
         logger.info("\nTop 10 Companies by Ranking:")
         logger.info(f"\n{top_10.to_string(index=False)}")
@@ -153,6 +273,37 @@ class SP500Analyzer:
         
         return top_10
 
+    def _save_run(self, companies: List[str], scores: List[Dict], top_10: Optional[pd.DataFrame],
+                  excluded: Optional[Dict[str, str]] = None, rebalance: Optional[RebalanceResult] = None) -> None:
+        """Persist the full score table, including tickers without a score.
+
+        Args:
+            companies: Every ticker in the universe
+            scores: Calculated stock scores
+            top_10: Final top 10 (with weights if computed)
+            excluded: Exclusion reasons of tickers removed before fetching
+            rebalance: Trades against the previous portfolio, if rebalancing
+        """
+        scored = pd.DataFrame(scores, columns=['Ticker', 'Score', 'Trailing_PE', 'Dividend_Yield'])
+        table = pd.DataFrame({'ticker': companies}).merge(
+            scored.rename(columns={'Ticker': 'ticker', 'Score': 'score', 'Trailing_PE': 'trailing_pe',
+                                   'Dividend_Yield': 'dividend_yield'}), on='ticker', how='left'
+        )
+        included = table['score'].notna()
+        table['status'] = included.map({True: 'Incluída', False: 'Excluída'})
+        table['exclusion_reason'] = table['status'].map({'Excluída': 'Missing metrics'})
+        if excluded:
+            table['exclusion_reason'] = table['ticker'].map(excluded).fillna(table['exclusion_reason'])
+        table['Final_Rank'] = table['score'].rank(ascending=False, method='first').astype('Int64')
+        if top_10 is not None:
+            table['held'] = table['ticker'].isin(top_10['Ticker'])
+        if top_10 is not None and 'Weight' in top_10:
+            table = table.merge(top_10[['Ticker', 'Weight']].rename(columns={'Ticker': 'ticker', 'Weight': 'weight'}),
+                                on='ticker', how='left')
+        if rebalance is not None:
+            table = self.rebalancer.merge_trades(table, rebalance)
+        self.store.write_run('factor_score', table)
+
 def main():
     """Main entry point of the program."""
     analyzer = SP500Analyzer()
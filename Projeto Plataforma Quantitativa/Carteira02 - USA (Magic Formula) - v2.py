@@ -1,12 +1,22 @@
-from typing import List, Dict, Optional, TypedDict
+from typing import List, Dict, Iterable, Optional, TypedDict
 import yfinance as yf
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup as bs
 import time
-from io import StringIO
 import logging
 from dataclasses import dataclass
+from weighting import PortfolioWeighter
+from ranking import Factor, composite_rank
+from statements import StatementPanel, fetch_statements
+from risk import portfolio_risk_report
+from results_store import ResultsStore
+import upstream
+from issuers import IssuerMap, unique_issuers
+from profiling import PipelineProfiler
+from journal import JobJournal
+from liquidity import LiquidityFilter
+from rebalancing import Rebalancer, RebalanceResult
+from universe import UniverseProvider, SP500Universe
+from concurrency import AdaptiveExecutor, failure_reason, is_retryable
 import lxml
 
 # Configure logging
@@ -17,14 +27,10 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class StockData(TypedDict):
-    """Type definition for stock financial data."""
-    EBIT: float
-    Total_Assets: float
-    Current_Assets: float
-    Current_Liabilities: float
-    Market_Cap: float
-    Total_Debt: float
-    Total_Cash: float
+    """Type definition for the raw financial data fetched per stock."""
+    Annual: pd.DataFrame
+    Quarterly: pd.DataFrame
+    Market_Cap: Optional[float]
 
 @dataclass
 class StockResult:
@@ -33,125 +39,174 @@ class StockResult:
     status: str
     roc: Optional[float] = None
     earnings_yield: Optional[float] = None
+    market_cap: Optional[float] = None
     missing_data: List[str] = None
 
     def __post_init__(self):
         if self.missing_data is None:
             self.missing_data = []
 
-class SP500Scraper:
-    """Class responsible for scraping S&P 500 data."""
-    
-    def __init__(self, url: str = 'https://www.slickcharts.com/sp500'):
-        self.url = url
-        self.headers = {'User-Agent': 'Mozilla/5.0'}
-
-    def get_tickers(self) -> List[str]:
-        """Retrieve list of S&P 500 tickers from web."""
-        try:
-            request = requests.get(self.url, headers=self.headers)
-            request.raise_for_status()
-            soup = bs(request.text, "lxml")
-            stats = soup.find('table', class_='table table-hover table-borderless table-sm')
-            
-            if not stats:
-                raise ValueError("Table not found in webpage")
-            
-            df = pd.read_html(StringIO(str(stats)))[0]
-            return df['Symbol'].tolist()
-            
-        except Exception as e:
-            logger.error(f"Error fetching S&P 500 tickers: {e}")
-            return []
-
 class MagicFormulaCalculator:
     """Class for calculating Magic Formula metrics."""
 
     @staticmethod
     def get_financial_data(stock: yf.Ticker) -> Optional[StockData]:
-        """Extract required financial data from stock information."""
+        """Fetch annual and quarterly statements plus market cap for one stock."""
         try:
-            income_stmt = stock.income_stmt
-            balance_sheet = stock.balance_sheet
-            info = stock.info
-
-            if income_stmt.empty or balance_sheet.empty:
+            statements = fetch_statements(stock)
+            if statements['annual'].empty and statements['quarterly'].empty:
                 return None
 
-            latest_income = income_stmt.iloc[:, 0]
-            latest_balance = balance_sheet.iloc[:, 0]
-
             return StockData(
-                EBIT=latest_income.get('EBIT'),
-                Total_Assets=latest_balance.get('Total Assets'),
-                Current_Assets=latest_balance.get('Current Assets'),
-                Current_Liabilities=latest_balance.get('Current Liabilities'),
-                Market_Cap=info.get('marketCap'),
-                Total_Debt=info.get('totalDebt'),
-                Total_Cash=info.get('totalCash')
+                Annual=statements['annual'],
+                Quarterly=statements['quarterly'],
+                Market_Cap=stock.info.get('marketCap')
             )
         except Exception as e:
+            if is_retryable(e):
+                raise
             logger.error(f"Error getting financial data: {e}")
             return None
 
     @staticmethod
-    def calculate_metrics(data: StockData) -> tuple[float, float]:
-        """Calculate ROC and Earnings Yield from financial data."""
-        net_fixed_assets = data['Total_Assets'] - data['Current_Assets']
-        working_capital = data['Current_Assets'] - data['Current_Liabilities']
-        enterprise_value = data['Market_Cap'] + data['Total_Debt'] - data['Total_Cash']
-        
-        denominator = working_capital + net_fixed_assets
-        if denominator == 0 or enterprise_value == 0:
-            raise ValueError("Division by zero in calculations")
-            
-        roc = data['EBIT'] / denominator
-        earnings_yield = data['EBIT'] / enterprise_value
-        
-        return roc, earnings_yield
+    def build_inputs(data: Dict[str, StockData], basis: str = 'annual',
+                     roc_years: int = 1) -> pd.DataFrame:
+        """Build the metric inputs for all stocks from statement panels.
+
+        Args:
+            data: Fetched financial data by ticker
+            basis: 'annual' for the latest fiscal year or 'ttm' for the last four quarters
+            roc_years: Number of annual periods averaged into ROC (1 keeps the latest year)
+
+        Returns:
+            pd.DataFrame: One row per ticker with the panel line items, Market_Cap and ROC
+        """
+        annual = StatementPanel.build({t: d['Annual'] for t, d in data.items()})
+        if basis == 'ttm':
+            quarterly = StatementPanel.build({t: d['Quarterly'] for t, d in data.items()})
+            inputs = quarterly.ttm()
+        else:
+            inputs = annual.latest()
+
+        inputs['Market_Cap'] = pd.Series({t: d['Market_Cap'] for t, d in data.items()}, dtype=float)
+        if roc_years > 1:
+            inputs['ROC'] = annual.average_roc(roc_years)
+        else:
+            capital = inputs['Total_Assets'] - inputs['Current_Liabilities']
+            inputs['ROC'] = inputs['EBIT'] / capital.where(capital != 0)
+        return inputs
+
+    @staticmethod
+    def calculate_metrics(inputs: pd.DataFrame) -> pd.DataFrame:
+        """Calculate ROC and Earnings Yield for every stock at once."""
+        enterprise_value = inputs['Market_Cap'] + inputs['Total_Debt'] - inputs['Total_Cash']
+        return pd.DataFrame({
+            'roc': inputs['ROC'],
+            'earnings_yield': inputs['EBIT'] / enterprise_value.where(enterprise_value != 0),
+        })
 
 class StockAnalyzer:
     """Main class for analyzing stocks using Magic Formula."""
-    
-    def analyze_stock(self, ticker: str, index: int, total: int) -> StockResult:
-        """Analyze a single stock using Magic Formula methodology."""
-        logger.info(f"Processing {ticker} ({index + 1}/{total})")
-        
+
+    def __init__(self, basis: str = 'annual', roc_years: int = 1,
+                 profiler: Optional[PipelineProfiler] = None, journal: Optional[JobJournal] = None,
+                 executor: Optional[AdaptiveExecutor] = None):
+        self.basis = basis
+        self.roc_years = roc_years
+        self.profiler = profiler or PipelineProfiler()
+        self.journal = journal or JobJournal()
+        self.executor = executor or AdaptiveExecutor()
+
+    def fetch_stock(self, ticker: str, index: int, total: Optional[int] = None) -> Optional[StockData]:
+        """Fetch the raw financial data of a single stock."""
+        logger.info(f"Processing {ticker} ({index + 1}{f'/{total}' if total else ''})")
         try:
-            stock = yf.Ticker(ticker)
-            financial_data = MagicFormulaCalculator.get_financial_data(stock)
-            
-            if not financial_data:
-                return StockResult(
+            return MagicFormulaCalculator.get_financial_data(upstream.Ticker(ticker))
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            logger.error(f"Error processing {ticker}: {e}")
+            return None
+
+    def analyze_stocks(self, tickers: Iterable[str],
+                       universe: Optional[UniverseProvider] = None) -> List[StockResult]:
+        """Analyze all stocks using Magic Formula methodology, fetching as tickers stream in.
+
+        Args:
+            tickers: Ticker stream to analyze
+            universe: Provider behind the stream, whose size is shown as the progress total
+        """
+        # Statements and market cap are company-level: fetch once per issuer
+        issuers = IssuerMap()
+        primaries = (
+            (len(issuers.listings) - 1, ticker) for ticker in tickers if issuers.add(ticker)
+        )
+
+        def fetch(item):
+            idx, ticker = item
+            total = universe.size if universe else None
+            return self.journal.run('fetch', ticker,
+                                    lambda: self.executor.call(self.fetch_stock, ticker, idx, total))
+
+        fetched, failed = {}, {}
+        with self.profiler.stage('fetch'):
+            for (_, ticker), data, error in self.executor.map(fetch, primaries):
+                if error:
+                    logger.warning(f"Giving up on {ticker} for this run: {error}")
+                    failed[ticker] = failure_reason(error)
+                if data:
+                    fetched[ticker] = data
+                self.profiler.check(ticker)
+        self.executor.log_metrics()
+        failed = {t: failed[primary] for t, primary in issuers.primary.items() if primary in failed}
+        tickers = list(issuers.primary)
+        fetched = issuers.fan_out(fetched)
+
+        if not fetched:
+            return [
+                StockResult(ticker=t, status='Excluída',
+                            missing_data=[failed.get(t, 'Dados financeiros não disponíveis')])
+                for t in tickers
+            ]
+
+        with self.profiler.stage('parse'):
+            inputs = MagicFormulaCalculator.build_inputs(fetched, self.basis, self.roc_years)
+        with self.profiler.stage('metrics'):
+            metrics = MagicFormulaCalculator.calculate_metrics(inputs)
+        required = [c for c in inputs.columns if c != 'ROC']
+        missing = inputs[required].isna()
+
+        results = []
+        for ticker in tickers:
+            if ticker not in fetched:
+                results.append(StockResult(
                     ticker=ticker,
                     status='Excluída',
-                    missing_data=['Dados financeiros não disponíveis']
-                )
-
-            # Check for missing data
-            missing = [k for k, v in financial_data.items() if v is None]
-            if missing:
-                return StockResult(
+                    missing_data=[failed.get(ticker, 'Dados financeiros não disponíveis')]
+                ))
+            elif missing.loc[ticker].any():
+                results.append(StockResult(
                     ticker=ticker,
                     status='Excluída',
-                    missing_data=missing
-                )
-
-            roc, earnings_yield = MagicFormulaCalculator.calculate_metrics(financial_data)
-            
-            return StockResult(
-                ticker=ticker,
-                status='Incluída',
-                roc=roc,
-                earnings_yield=earnings_yield
-            )
-
-        except Exception as e:
-            return StockResult(
-                ticker=ticker,
-                status='Excluída',
-                missing_data=[str(e)]
-            )
+                    market_cap=fetched[ticker]['Market_Cap'],
+                    missing_data=list(missing.columns[missing.loc[ticker]])
+                ))
+            elif metrics.loc[ticker].isna().any():
+                results.append(StockResult(
+                    ticker=ticker,
+                    status='Excluída',
+                    market_cap=fetched[ticker]['Market_Cap'],
+                    missing_data=['Division by zero in calculations']
+                ))
+            else:
+                results.append(StockResult(
+                    ticker=ticker,
+                    status='Incluída',
+                    roc=metrics.at[ticker, 'roc'],
+                    earnings_yield=metrics.at[ticker, 'earnings_yield'],
+                    market_cap=fetched[ticker]['Market_Cap']
+                ))
+        return results
 
 class ResultsProcessor:
     """Class for processing and presenting analysis results."""
@@ -166,17 +221,8 @@ class ResultsProcessor:
             return None
             
         df = pd.DataFrame(included)
-        
-        # Calculate rankings
-        df['ROC_Rank'] = df['roc'].rank(ascending=False)
-        df['EY_Rank'] = df['earnings_yield'].rank(ascending=False)
-        df['Combined_Rank'] = (df['ROC_Rank'] + df['EY_Rank']) / 2
-        
-        # Sort and add final ranking
-        df = df.sort_values('Combined_Rank').reset_index(drop=True)
-        df['Final_Rank'] = df.index + 1
-        
-        return df
+        factors = [Factor('roc', name='ROC_Rank'), Factor('earnings_yield', name='EY_Rank')]
+        return composite_rank(df, factors)
 
     @staticmethod
     def print_results(results: List[StockResult], rankings_df: Optional[pd.DataFrame], 
@@ -184,7 +230,7 @@ class ResultsProcessor:
         """Print analysis results and statistics."""
         if rankings_df is not None:
             logger.info("\nTop 10 Companies by Magic Formula:")
-            logger.info(rankings_df[['Final_Rank', 'ticker']].head(10).to_string(index=False))
+            logger.info(unique_issuers(rankings_df)[['Final_Rank', 'ticker']].head(10).to_string(index=False))
 
         excluded = [r for r in results if r.status == 'Excluída']
         
@@ -202,29 +248,50 @@ class ResultsProcessor:
 class MagicFormulaAnalysis:
     """Main class orchestrating the entire analysis process."""
     
-    def __init__(self):
-        self.scraper = SP500Scraper()
-        self.analyzer = StockAnalyzer()
+    def __init__(self, weighting_method: Optional[str] = None, risk_report: bool = False,
+                 basis: str = 'annual', roc_years: int = 1, results_dir: Optional[str] = 'results',
+                 profiler: Optional[PipelineProfiler] = None, run_id: Optional[str] = None,
+                 liquidity: Optional[LiquidityFilter] = None, rebalancer: Optional[Rebalancer] = None,
+                 universe: Optional[UniverseProvider] = None, executor: Optional[AdaptiveExecutor] = None):
+        self.profiler = profiler or PipelineProfiler()
+        self.journal = JobJournal(run_id)
+        self.liquidity = liquidity
+        self.rebalancer = rebalancer
+        self.universe = universe or SP500Universe()
+        self.analyzer = StockAnalyzer(basis, roc_years, self.profiler, self.journal, executor)
         self.processor = ResultsProcessor()
+        self.weighting_method = weighting_method
+        self.weighter = PortfolioWeighter() if weighting_method else None
+        self.risk_report = risk_report
+        self.store = ResultsStore(results_dir) if results_dir else None
 
     def run_analysis(self) -> Optional[pd.DataFrame]:
         """Execute complete Magic Formula analysis."""
+        with self.profiler.session():
+            return self._run_analysis()
+
+    def _run_analysis(self) -> Optional[pd.DataFrame]:
+        """Run the analysis stages, profiled when profiling is enabled."""
         start_time = time.time()
         
-        # Get companies list
-        companies = self.scraper.get_tickers()
-        if not companies:
+        # Stream the universe, dropping untradable names before any fundamentals are fetched
+        excluded = {}
+        tickers = iter(self.universe)
+        if self.liquidity:
+            tickers = self.liquidity.stream(tickers, excluded)
+
+        # Analyze all companies
+        results = self.analyzer.analyze_stocks(tickers, self.universe)
+        if not results and not excluded:
             logger.error("Failed to retrieve company list")
             return None
-            
-        # Analyze all companies
-        results = [
-            self.analyzer.analyze_stock(ticker, idx, len(companies))
-            for idx, ticker in enumerate(companies)
-        ]
+        results += [StockResult(ticker=t, status='Excluída', missing_data=[reason]) for t, reason in excluded.items()]
+        if self.liquidity:
+            self.liquidity.record_market_caps({r.ticker: r.market_cap for r in results})
         
         # Process results
-        rankings_df = self.processor.prepare_rankings(results)
+        with self.profiler.stage('ranking'):
+            rankings_df = self.processor.prepare_rankings(results)
         
         # Print results
         self.processor.print_results(
@@ -233,7 +300,42 @@ class MagicFormulaAnalysis:
             time.time() - start_time
         )
         
-        return rankings_df[['Final_Rank', 'ticker']].head(10) if rankings_df is not None else None
+        if rankings_df is None:
+            if self.store:
+                self._save_run(results, None, None)
+            return None
+
+        ranked = unique_issuers(rankings_df)
+        previous = None
+        if self.rebalancer:
+            previous = self.rebalancer.previous_weights('magic_formula')
+            ranked = ranked[ranked['ticker'].isin(self.rebalancer.select(ranked['ticker'], previous.index))]
+        top_10 = ranked[['Final_Rank', 'ticker']].head(10)
+        if self.weighter:
+            weights = self.weighter.weights(top_10['ticker'].tolist(), self.weighting_method)
+            top_10 = top_10.assign(weight=weights.values.round(4))
+        if self.risk_report:
+            cache = self.weighter.cache if self.weighter else None
+            report = portfolio_risk_report(top_10['ticker'].tolist(), top_10.get('weight'), cache)
+            logger.info(f"\nRolling 1-year risk:\n{report.round(4).to_string()}")
+        rebalance = None
+        if self.rebalancer:
+            rebalance = self.rebalancer.rebalance(top_10['ticker'], top_10.get('weight'), previous)
+        if self.store:
+            self._save_run(results, rankings_df, top_10, rebalance)
+        return top_10
+
+    def _save_run(self, results: List[StockResult], rankings_df: Optional[pd.DataFrame],
+                  top_10: Optional[pd.DataFrame], rebalance: Optional[RebalanceResult] = None) -> None:
+        """Persist the full ranking, metrics, exclusion reasons and trades of this run."""
+        table = self.store.build_table(results, rankings_df)
+        if top_10 is not None:
+            table['held'] = table['ticker'].isin(top_10['ticker'])
+        if top_10 is not None and 'weight' in top_10:
+            table = table.merge(top_10[['ticker', 'weight']], on='ticker', how='left')
+        if rebalance is not None:
+            table = self.rebalancer.merge_trades(table, rebalance)
+        self.store.write_run('magic_formula', table)
 
 def main() -> Optional[pd.DataFrame]:
     """Main entry point of the program."""
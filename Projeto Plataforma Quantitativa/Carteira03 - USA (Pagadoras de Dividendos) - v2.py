@@ -1,12 +1,24 @@
 from typing import List, Dict, Optional, TypedDict
 import yfinance as yf
+import numpy as np
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup as bs
 import time
-from io import StringIO
 import logging
 from dataclasses import dataclass
+from market_data import PriceMatrixCache
+from weighting import PortfolioWeighter
+from ranking import Factor, composite_rank
+from dividends import DividendMetrics
+from risk import portfolio_risk_report
+from results_store import ResultsStore
+import upstream
+from issuers import unique_issuers
+from profiling import PipelineProfiler
+from journal import JobJournal
+from liquidity import LiquidityFilter
+from rebalancing import Rebalancer, RebalanceResult
+from universe import UniverseProvider, SP500Universe, batched
+from concurrency import AdaptiveExecutor, failure_reason, is_retryable
 import lxml
 from datetime import datetime
 
@@ -23,6 +35,7 @@ class StockInfo(TypedDict):
     current_price: float
     short_name: str
     sector: str
+    market_cap: Optional[float]
 
 @dataclass
 class DividendResult:
@@ -33,53 +46,46 @@ class DividendResult:
     sector: Optional[str] = None
     current_price: Optional[float] = None
     dividend_yield: Optional[float] = None
+    forward_yield: Optional[float] = None
+    ttm_dividend: Optional[float] = None
+    dividend_cagr_5y: Optional[float] = None
     consecutive_years: Optional[int] = None
+    market_cap: Optional[float] = None
     missing_data: List[str] = None
 
     def __post_init__(self):
         if self.missing_data is None:
             self.missing_data = []
 
-class SP500Scraper:
-    """Class responsible for scraping S&P 500 data."""
-    
-    def __init__(self, url: str = 'https://www.slickcharts.com/sp500'):
-        self.url = url
-        self.headers = {'User-Agent': 'Mozilla/5.0'}
-
-    def get_tickers(self) -> List[str]:
-        """Retrieve list of S&P 500 tickers from web."""
-        try:
-            request = requests.get(self.url, headers=self.headers)
-            request.raise_for_status()
-            soup = bs(request.text, "lxml")
-            stats = soup.find('table', class_='table table-hover table-borderless table-sm')
-            
-            if not stats:
-                raise ValueError("Table not found in webpage")
-            
-            df = pd.read_html(StringIO(str(stats)))[0]
-            return df['Symbol'].tolist()
-            
-        except Exception as e:
-            logger.error(f"Error fetching S&P 500 tickers: {e}")
-            return []
-
 class DividendAnalyzer:
     """Class for analyzing dividend metrics."""
 
     @staticmethod
-    def get_stock_info(stock: yf.Ticker) -> Optional[StockInfo]:
-        """Extract required stock information."""
+    def get_stock_info(stock: yf.Ticker, metrics: Optional[pd.Series] = None) -> Optional[StockInfo]:
+        """Extract required stock information.
+
+        The yield is always the TTM yield from the bulk dividend metrics, so every
+        name is ranked on the same measure; the `dividendYield` snapshot in `info` is
+        often missing or differently scaled. Names without TTM dividends get 0.
+        """
         try:
             info = stock.info
+            ttm_yield = metrics['ttm_yield'] if metrics is not None else np.nan
+            dividend_yield = ttm_yield * 100 if ttm_yield > 0 else 0
+            current_price = info.get("currentPrice") or 0
+            if ttm_yield > 0:
+                current_price = current_price or metrics['ttm_dividend'] / ttm_yield
+
             return StockInfo(
-                dividend_yield=info.get("dividendYield", 0) * 100,
-                current_price=info.get("currentPrice", 0),
+                dividend_yield=dividend_yield,
+                current_price=current_price,
                 short_name=info.get("shortName", "N/A"),
-                sector=info.get("sector", "N/A")
+                sector=info.get("sector", "N/A"),
+                market_cap=info.get("marketCap")
             )
         except Exception as e:
+            if is_retryable(e):
+                raise
             logger.error(f"Error getting stock info: {e}")
             return None
 
@@ -105,13 +111,14 @@ class DividendAnalyzer:
 class StockAnalyzer:
     """Main class for analyzing stocks using dividend metrics."""
     
-    def analyze_stock(self, ticker: str, index: int, total: int) -> DividendResult:
+    def analyze_stock(self, ticker: str, index: int, total: Optional[int] = None,
+                      metrics: Optional[pd.Series] = None) -> DividendResult:
         """Analyze a single stock's dividend history and metrics."""
-        logger.info(f"Processing {ticker} ({index + 1}/{total})")
+        logger.info(f"Processing {ticker} ({index + 1}{f'/{total}' if total else ''})")
         
         try:
-            stock = yf.Ticker(ticker)
-            stock_info = DividendAnalyzer.get_stock_info(stock)
+            stock = upstream.Ticker(ticker)
+            stock_info = DividendAnalyzer.get_stock_info(stock, metrics)
             
             if not stock_info:
                 return DividendResult(
@@ -125,6 +132,7 @@ class StockAnalyzer:
                 return DividendResult(
                     ticker=ticker,
                     status='Excluída',
+                    market_cap=stock_info['market_cap'],
                     missing_data=['Dados insuficientes de dividendos']
                 )
 
@@ -139,10 +147,16 @@ class StockAnalyzer:
                 sector=stock_info['sector'],
                 current_price=stock_info['current_price'],
                 dividend_yield=round(stock_info['dividend_yield'], 2),
-                consecutive_years=consecutive_years
+                forward_yield=round(metrics['forward_yield'] * 100, 2) if metrics is not None else None,
+                ttm_dividend=metrics['ttm_dividend'] if metrics is not None else None,
+                dividend_cagr_5y=metrics['dividend_cagr_5y'] if metrics is not None else None,
+                consecutive_years=consecutive_years,
+                market_cap=stock_info['market_cap']
             )
 
         except Exception as e:
+            if is_retryable(e):
+                raise
             return DividendResult(
                 ticker=ticker,
                 status='Excluída',
@@ -153,8 +167,8 @@ class ResultsProcessor:
     """Class for processing and presenting analysis results."""
     
     @staticmethod
-    def prepare_rankings(results: List[DividendResult]) -> Optional[pd.DataFrame]:
-        """Process results and create rankings."""
+    def prepare_rankings(results: List[DividendResult], group_by: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """Process results and create rankings, optionally within `group_by` groups (e.g. 'sector')."""
         included = [r for r in results if r.status == 'Incluída']
         
         if not included:
@@ -162,17 +176,8 @@ class ResultsProcessor:
             return None
             
         df = pd.DataFrame(included)
-        
-        # Calculate rankings
-        df['Yield_Rank'] = df['dividend_yield'].rank(ascending=False)
-        df['Years_Rank'] = df['consecutive_years'].rank(ascending=False)
-        df['Combined_Rank'] = (df['Yield_Rank'] + df['Years_Rank']) / 2
-        
-        # Sort and add final ranking
-        df = df.sort_values('Combined_Rank').reset_index(drop=True)
-        df['Final_Rank'] = df.index + 1
-        
-        return df
+        factors = [Factor('dividend_yield', name='Yield_Rank'), Factor('consecutive_years', name='Years_Rank')]
+        return composite_rank(df, factors, group_by=group_by)
 
     @staticmethod
     def print_results(results: List[DividendResult], rankings_df: Optional[pd.DataFrame], 
@@ -180,7 +185,7 @@ class ResultsProcessor:
         """Print analysis results and statistics."""
         if rankings_df is not None:
             logger.info("\nTop 10 Companies by Dividend Model:")
-            display_df = rankings_df[['Final_Rank', 'ticker', 'dividend_yield', 'consecutive_years']].head(10)
+            display_df = unique_issuers(rankings_df)[['Final_Rank', 'ticker', 'dividend_yield', 'consecutive_years']].head(10)
             display_df.columns = ['Final_Rank', 'Ticker', 'Dividend Yield (%)', 'Anos de Dividendos Consecutivos']
             logger.info(display_df.to_string(index=False))
 
@@ -200,29 +205,81 @@ class ResultsProcessor:
 class DividendAnalysis:
     """Main class orchestrating the entire analysis process."""
     
-    def __init__(self):
-        self.scraper = SP500Scraper()
+    def __init__(self, weighting_method: Optional[str] = None, risk_report: bool = False,
+                 sector_neutral: bool = False, results_dir: Optional[str] = 'results',
+                 profiler: Optional[PipelineProfiler] = None, run_id: Optional[str] = None,
+                 liquidity: Optional[LiquidityFilter] = None, rebalancer: Optional[Rebalancer] = None,
+                 universe: Optional[UniverseProvider] = None, executor: Optional[AdaptiveExecutor] = None):
+        self.universe = universe or SP500Universe()
         self.analyzer = StockAnalyzer()
+        self.executor = executor or AdaptiveExecutor()
         self.processor = ResultsProcessor()
+        # One cache for the prefilter and the dividend metrics, so each batch is downloaded once
+        self.cache = liquidity.cache if liquidity else PriceMatrixCache()
+        self.dividend_metrics = DividendMetrics(self.cache)
+        self.weighting_method = weighting_method
+        self.weighter = PortfolioWeighter(self.cache) if weighting_method else None
+        self.risk_report = risk_report
+        self.store = ResultsStore(results_dir) if results_dir else None
+        self.profiler = profiler or PipelineProfiler()
+        self.journal = JobJournal(run_id)
+        self.liquidity = liquidity
+        self.rebalancer = rebalancer
+        self.sector_neutral = sector_neutral
 
     def run_analysis(self) -> Optional[pd.DataFrame]:
         """Execute complete dividend analysis."""
+        with self.profiler.session():
+            return self._run_analysis()
+
+    def _run_analysis(self) -> Optional[pd.DataFrame]:
+        """Run the analysis stages, profiled when profiling is enabled."""
         start_time = time.time()
         
-        # Get companies list
-        companies = self.scraper.get_tickers()
-        if not companies:
+        # Stream the universe, dropping untradable names before any per-ticker fetch
+        excluded = {}
+        tickers = iter(self.universe)
+        if self.liquidity:
+            tickers = self.liquidity.stream(tickers, excluded)
+
+        def analyze(item):
+            idx, ticker, row = item
+            return self.journal.run('analyze', ticker, lambda: self.executor.call(
+                self.analyzer.analyze_stock, ticker, idx, self.universe.size, metrics=row
+            ))
+
+        # Analyze companies batch by batch, with TTM dividend metrics for each batch in one pass
+        results = []
+        with self.profiler.stage('fetch'), self.cache.deferred_save():
+            for batch in batched(tickers):
+                metrics = self._batch_metrics(batch)
+                if metrics is None:
+                    # Without TTM yields the batch cannot be ranked on the same footing as the rest
+                    results += [DividendResult(ticker=t, status='Excluída',
+                                               missing_data=['Métricas de dividendos indisponíveis'])
+                                for t in batch]
+                    continue
+                items = [(len(results) + i, ticker, metrics.loc[ticker] if ticker in metrics.index else None)
+                         for i, ticker in enumerate(batch)]
+                for (_, ticker, _), result, error in self.executor.map(analyze, items):
+                    if error:
+                        logger.warning(f"Giving up on {ticker} for this run: {error}")
+                        result = DividendResult(ticker=ticker, status='Excluída', missing_data=[failure_reason(error)])
+                    results.append(result)
+                    self.profiler.check(ticker)
+        self.executor.log_metrics()
+        if not results and not excluded:
             logger.error("Failed to retrieve company list")
             return None
-            
-        # Analyze all companies
-        results = [
-            self.analyzer.analyze_stock(ticker, idx, len(companies))
-            for idx, ticker in enumerate(companies)
-        ]
+        results += [DividendResult(ticker=t, status='Excluída', missing_data=[reason]) for t, reason in excluded.items()]
+        if self.liquidity:
+            self.liquidity.record_market_caps({r.ticker: r.market_cap for r in results})
         
         # Process results
-        rankings_df = self.processor.prepare_rankings(results)
+        with self.profiler.stage('ranking'):
+            rankings_df = self.processor.prepare_rankings(
+                results, 'sector' if self.sector_neutral else None
+            )
         
         # Print results
         self.processor.print_results(
@@ -231,9 +288,49 @@ class DividendAnalysis:
             time.time() - start_time
         )
         
-        if rankings_df is not None:
-            return rankings_df[['Final_Rank', 'ticker', 'dividend_yield', 'consecutive_years']].head(10)
-        return None
+        if rankings_df is None:
+            if self.store:
+                self._save_run(results, None, None)
+            return None
+
+        ranked = unique_issuers(rankings_df)
+        previous = None
+        if self.rebalancer:
+            previous = self.rebalancer.previous_weights('dividends')
+            ranked = ranked[ranked['ticker'].isin(self.rebalancer.select(ranked['ticker'], previous.index))]
+        top_10 = ranked[['Final_Rank', 'ticker', 'dividend_yield', 'consecutive_years']].head(10)
+        if self.weighter:
+            weights = self.weighter.weights(top_10['ticker'].tolist(), self.weighting_method)
+            top_10 = top_10.assign(weight=weights.values.round(4))
+        if self.risk_report:
+            report = portfolio_risk_report(top_10['ticker'].tolist(), top_10.get('weight'), self.cache)
+            logger.info(f"\nRolling 1-year risk:\n{report.round(4).to_string()}")
+        rebalance = None
+        if self.rebalancer:
+            rebalance = self.rebalancer.rebalance(top_10['ticker'], top_10.get('weight'), previous)
+        if self.store:
+            self._save_run(results, rankings_df, top_10, rebalance)
+        return top_10
+
+    def _batch_metrics(self, tickers: List[str]) -> Optional[pd.DataFrame]:
+        """TTM dividend metrics of one batch (None if the bulk download fails)."""
+        try:
+            return self.dividend_metrics.compute(tickers)
+        except Exception as e:
+            logger.error(f"Error computing bulk dividend metrics, excluding {len(tickers)} tickers: {e}")
+            return None
+
+    def _save_run(self, results: List[DividendResult], rankings_df: Optional[pd.DataFrame],
+                  top_10: Optional[pd.DataFrame], rebalance: Optional[RebalanceResult] = None) -> None:
+        """Persist the full ranking, metrics, exclusion reasons and trades of this run."""
+        table = self.store.build_table(results, rankings_df)
+        if top_10 is not None:
+            table['held'] = table['ticker'].isin(top_10['ticker'])
+        if top_10 is not None and 'weight' in top_10:
+            table = table.merge(top_10[['ticker', 'weight']], on='ticker', how='left')
+        if rebalance is not None:
+            table = self.rebalancer.merge_trades(table, rebalance)
+        self.store.write_run('dividends', table)
 
 def main() -> Optional[pd.DataFrame]:
     """Main entry point of the program."""
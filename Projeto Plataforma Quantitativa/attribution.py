@@ -0,0 +1,227 @@
+from typing import List, Optional, Sequence
+import logging
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from market_data import PriceMatrixCache
+from results_store import ResultsStore
+from factor_eval import factor_panel, quantile_buckets, quantile_returns
+from simulation import latest_portfolios, portfolio_returns
+from risk import TRADING_DAYS, _window_sums
+
+logger = logging.getLogger(__name__)
+
+FACTORS = ('market', 'size', 'value', 'momentum', 'quality')
+
+# Fundamentals stored by the Magic Formula runs: factor -> (strategy, column)
+FUNDAMENTAL_FACTORS = {'value': ('magic_formula', 'earnings_yield'), 'quality': ('magic_formula', 'roc')}
+
+# Stored runs recording market caps, in order of preference when both have a ticker
+MARKET_CAP_SOURCES = (('magic_formula', 'market_cap'), ('dividends', 'market_cap'))
+
+@dataclass
+class FactorExposures:
+    """Data class to store rolling factor regressions of many return series."""
+    exposures: pd.DataFrame
+    alpha: pd.DataFrame
+    r_squared: pd.DataFrame
+
+    def latest(self) -> pd.DataFrame:
+        """Series x (alpha, factor betas, R²) of the last window."""
+        betas = self.exposures.iloc[-1].unstack(level='factor')
+        return pd.concat([self.alpha.iloc[-1].rename('alpha'), betas,
+                          self.r_squared.iloc[-1].rename('r_squared')], axis=1)
+
+def _carry_forward(panel: pd.DataFrame, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """Values of each run date carried forward onto `dates` (NaN before the first run)."""
+    return panel.reindex(panel.index.union(dates)).ffill().reindex(dates)
+
+def characteristic_panel(store: ResultsStore, strategy: str, column: str,
+                         dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """Stored per-ticker values carried forward from each run date onto `dates`.
+
+    Dates before the first stored run stay NaN, so the factor never uses values
+    that were not known yet.
+    """
+    panel = factor_panel(store, strategy, column)
+    if panel.empty:
+        return panel
+    return _carry_forward(panel, dates)
+
+def market_cap_panel(store: ResultsStore, prices: pd.DataFrame) -> pd.DataFrame:
+    """Daily market caps from the share counts implied by the stored runs.
+
+    Each run's market cap over that day's close gives the share count at the run
+    date; it is carried forward and multiplied by the later closes, so a date
+    never uses a share count reported after it. Dates before the first run are NaN.
+    """
+    closes = prices.sort_index().ffill()
+    shares = pd.DataFrame()
+    for strategy, column in MARKET_CAP_SOURCES:
+        caps = factor_panel(store, strategy, column).reindex(columns=prices.columns)
+        if caps.empty:
+            continue
+        at_run = _carry_forward(closes, caps.index)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            implied = caps / at_run.where(at_run > 0)
+        shares = implied if shares.empty else shares.combine_first(implied)
+    if shares.empty:
+        return shares
+    return _carry_forward(shares, prices.index) * prices
+
+def long_short(characteristic: pd.DataFrame, returns: pd.DataFrame, quantiles: int = 3) -> pd.Series:
+    """Daily return of the equal-weighted top minus bottom quantile by a characteristic.
+
+    Portfolios are formed on the previous day's values, so a day's return never
+    uses that day's characteristic.
+    """
+    characteristic = characteristic.reindex(index=returns.index, columns=returns.columns).shift(1)
+    buckets = quantile_buckets(characteristic.to_numpy(dtype=float), quantiles)
+    means = quantile_returns(buckets, returns.to_numpy(dtype=float), quantiles)
+    return pd.Series(means[:, -1] - means[:, 0], index=returns.index)
+
+def factor_returns(cache: Optional[PriceMatrixCache] = None, store: Optional[ResultsStore] = None,
+                   benchmark: str = 'SPY', quantiles: int = 3,
+                   momentum: Sequence[int] = (TRADING_DAYS, 21)) -> pd.DataFrame:
+    """Daily factor returns built from the cached prices and stored fundamentals.
+
+    - market: the benchmark return (equal-weighted universe if it is not cached)
+    - size: small minus big by market cap (closes times the shares implied by stored runs)
+    - value: high minus low earnings yield from the Magic Formula runs
+    - momentum: winners minus losers over `momentum[0]` days skipping the last `momentum[1]`
+    - quality: high minus low return on capital from the Magic Formula runs
+
+    Factors built from stored runs are NaN before the first run; factors without
+    any stored run are left out.
+    """
+    cache = cache or PriceMatrixCache()
+    store = store or ResultsStore()
+    prices = cache.prices.drop(columns=[benchmark], errors='ignore')
+    returns = prices.pct_change(fill_method=None)
+
+    factors = {}
+    if benchmark in cache.prices:
+        factors['market'] = cache.prices[benchmark].pct_change(fill_method=None)
+    else:
+        factors['market'] = returns.mean(axis=1)
+
+    market_caps = market_cap_panel(store, prices)
+    if not market_caps.empty:
+        factors['size'] = long_short(-np.log(market_caps), returns, quantiles)
+
+    for name, (strategy, column) in FUNDAMENTAL_FACTORS.items():
+        panel = characteristic_panel(store, strategy, column, prices.index)
+        if not panel.empty:
+            factors[name] = long_short(panel, returns, quantiles)
+
+    lookback, skip = momentum
+    factors['momentum'] = long_short(prices.shift(skip) / prices.shift(lookback) - 1, returns, quantiles)
+
+    missing = [f for f in FACTORS if f not in factors]
+    if missing:
+        logger.warning(f"No inputs for factors: {', '.join(missing)}")
+    return pd.DataFrame(factors)[[f for f in FACTORS if f in factors]].iloc[1:]
+
+def rolling_regression(series: pd.DataFrame, factors: pd.DataFrame, window: int = TRADING_DAYS,
+                       budget: int = 20_000_000) -> FactorExposures:
+    """OLS of every series on the factors over every trailing window, batched.
+
+    The factor windows are stacked into a (windows x days x regressors) array whose
+    normal-equation matrices are inverted in one batched call. The cross moments
+    with the series, a (windows x regressors x series) array, come from cumulative
+    sums as in the risk engine, so every window of every series is solved together
+    with no per-window loop. Series are processed in chunks of at most `budget`
+    floats. Windows where a series has a missing return produce NaN for that series.
+    A factor missing on any day of a window (e.g. before the first stored run) is
+    left out of that window's regression and gets a NaN exposure there.
+
+    Args:
+        series: Date x series daily returns (portfolios, constituents)
+        factors: Date x factor daily returns; dates with no factor at all are dropped
+        window: Regression window in trading days
+        budget: Floats per chunk of cumulative cross moments
+
+    Returns:
+        FactorExposures: Betas (columns factor x series), annualized alpha and R²
+        at the end date of each window
+    """
+    factors = factors.dropna(how='all')
+    dates = factors.index.intersection(series.index)
+    if len(dates) < window:
+        raise ValueError(f"Need at least {window} common observations, got {len(dates)}")
+    X = np.column_stack([np.ones(len(dates)), factors.loc[dates].to_numpy(dtype=float)])
+    Y = series.loc[dates].to_numpy(dtype=float)
+
+    # Regressors observed on every day of each window; the others have their rows and
+    # columns of the normal equations zeroed, which the pseudo-inverse solves with a zero beta
+    included = _window_sums(np.isnan(X).astype(float), window) == 0
+    X = np.nan_to_num(X)
+    mask = included.astype(float)
+    Xw = sliding_window_view(X, window, axis=0)
+    xtx = np.matmul(Xw, Xw.transpose(0, 2, 1)) * mask[:, :, None] * mask[:, None, :]
+    xtx_inv = np.linalg.pinv(xtx)
+
+    n_windows, n_series = len(Xw), Y.shape[1]
+    coefficients = np.full((n_windows, X.shape[1], n_series), np.nan)
+    r_squared = np.full((n_windows, n_series), np.nan)
+    step = max(1, budget // (len(X) * X.shape[1]))
+    for start in range(0, n_series, step):
+        columns = slice(start, min(start + step, n_series))
+        values = Y[:, columns]
+        complete = _window_sums(np.isnan(values).astype(float), window) == 0
+        values = np.nan_to_num(values)
+
+        xty = _window_sums(X[:, :, None] * values[:, None, :], window) * mask[:, :, None]
+        beta = np.matmul(xtx_inv, xty)
+        yty = _window_sums(values ** 2, window)
+        total = yty - _window_sums(values, window) ** 2 / window
+        residual = yty - np.sum(beta * xty, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r2 = 1 - residual / total
+        coefficients[:, :, columns] = np.where(complete[:, None, :] & included[:, :, None], beta, np.nan)
+        r_squared[:, columns] = np.where(complete, r2, np.nan)
+
+    ends = dates[window - 1:]
+    names = list(factors.columns)
+    exposures = pd.DataFrame(
+        coefficients[:, 1:, :].reshape(n_windows, -1), index=ends,
+        columns=pd.MultiIndex.from_product([names, series.columns], names=['factor', 'series'])
+    )
+    return FactorExposures(
+        exposures=exposures,
+        alpha=pd.DataFrame(coefficients[:, 0, :] * TRADING_DAYS, index=ends, columns=series.columns),
+        r_squared=pd.DataFrame(r_squared, index=ends, columns=series.columns)
+    )
+
+def attribute_strategies(window: int = TRADING_DAYS, constituents: bool = True,
+                         cache: Optional[PriceMatrixCache] = None,
+                         store: Optional[ResultsStore] = None) -> Optional[FactorExposures]:
+    """Rolling factor exposures of the latest factor, Magic Formula and dividend portfolios.
+
+    Args:
+        window: Regression window in trading days
+        constituents: Also regress every constituent of the portfolios
+        cache: Shared price cache
+        store: Results store holding the runs and fundamentals
+
+    Returns:
+        Optional[FactorExposures]: Exposures of every portfolio (and constituent),
+        None when no strategy has stored runs
+    """
+    cache = cache or PriceMatrixCache()
+    store = store or ResultsStore()
+    portfolios = latest_portfolios(store=store)
+    if not portfolios:
+        return None
+
+    series = portfolio_returns(portfolios, cache).drop(columns='SPY')
+    if constituents:
+        tickers: List[str] = sorted({t for weights in portfolios.values() for t in weights.index})
+        series = series.join(cache.returns(tickers).drop(columns=series.columns, errors='ignore'))
+    factors = factor_returns(cache, store)
+    result = rolling_regression(series, factors, window)
+
+    summary = result.latest().loc[list(portfolios)]
+    logger.info(f"\nFactor exposures over the last {window} days:\n{summary.round(3).to_string()}")
+    return result
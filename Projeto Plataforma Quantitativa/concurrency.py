@@ -0,0 +1,230 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import re
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+import numpy as np
+from journal import is_transient
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_PATTERN = re.compile(r'\b429\b|too many requests|rate limit', re.IGNORECASE)
+
+def is_throttled(error: BaseException) -> bool:
+    """Whether an upstream error means Yahoo is throttling us (HTTP 429)."""
+    if type(error).__name__ == 'YFRateLimitError':
+        return True
+    if getattr(getattr(error, 'response', None), 'status_code', None) == 429:
+        return True
+    return bool(THROTTLE_PATTERN.search(str(error)))
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a per-ticker handler should re-raise an error rather than record a result."""
+    return is_throttled(error) or is_transient(error)
+
+class ThrottledError(RuntimeError):
+    """Raised when a request is still throttled after every retry."""
+
+def failure_reason(error: BaseException) -> str:
+    """Exclusion reason of a ticker whose fetch failed on every retry."""
+    return 'Rate limited' if isinstance(error, ThrottledError) else 'Network error'
+
+@dataclass
+class Decision:
+    """Data class to store one change of the concurrency limit."""
+    at: float
+    limit: int
+    reason: str
+    p50: float
+    p95: float
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight requests, driven by latency and throttling.
+
+    The limit grows by one after each round of `limit` completions without
+    trouble. A throttled response cuts it by `backoff`, and a median latency over
+    `latency_tolerance` times the best median seen so far cuts it by
+    `latency_backoff`. Only requests started after the last cut can cut it again,
+    so one burst of slow or throttled responses counts once.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16, backoff: float = 0.5,
+                 latency_backoff: float = 0.8, latency_tolerance: float = 2.0, window: int = 50):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.decisions: List[Decision] = []
+
+        self._condition = threading.Condition()
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._baseline = np.inf
+        self._last_cut = 0.0
+        self._since_change = 0
+        self._counts = {'completed': 0, 'throttled': 0, 'failed': 0}
+        self._started = time.monotonic()
+
+    def acquire(self) -> float:
+        """Wait for a free slot and return the request's start time."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, outcome: str = 'completed') -> None:
+        """Record a finished request ('completed', 'throttled' or 'failed') and adapt the limit."""
+        latency = time.monotonic() - started
+        with self._condition:
+            self.in_flight -= 1
+            self._counts[outcome] += 1
+            self._outcomes.append(outcome)
+            if outcome == 'completed':
+                self._latencies.append(latency)
+            self._adapt(started, outcome)
+            self._condition.notify_all()
+
+    def _percentiles(self) -> Tuple[float, float]:
+        if not self._latencies:
+            return np.nan, np.nan
+        p50, p95 = np.percentile(self._latencies, [50, 95])
+        return float(p50), float(p95)
+
+    def _adapt(self, started: float, outcome: str) -> None:
+        p50, p95 = self._percentiles()
+        recent = started >= self._last_cut
+        if outcome == 'throttled' and recent:
+            self._set(self.limit * self.backoff, 'throttled', p50, p95, cut=True)
+            return
+
+        if len(self._latencies) >= min(10, self._latencies.maxlen):
+            # Let the baseline drift up slowly so a lasting slowdown is eventually accepted
+            self._baseline = min(p50, self._baseline * 1.001)
+            if recent and p50 > self.latency_tolerance * self._baseline:
+                self._set(self.limit * self.latency_backoff, 'latency', p50, p95, cut=True)
+                return
+
+        self._since_change += outcome == 'completed'
+        if self._since_change >= int(self.limit):
+            self._set(self.limit + 1, 'probe', p50, p95)
+
+    def _set(self, limit: float, reason: str, p50: float, p95: float, cut: bool = False) -> None:
+        limit = min(max(limit, self.minimum), self.maximum)
+        self._since_change = 0
+        if cut:
+            self._last_cut = time.monotonic()
+        if int(limit) != int(self.limit):
+            self.decisions.append(Decision(time.monotonic() - self._started, int(limit), reason, p50, p95))
+            logger.debug(f"Concurrency limit {int(self.limit)} -> {int(limit)} ({reason})")
+        self.limit = limit
+
+    def metrics(self) -> Dict[str, Any]:
+        """Current limit, in-flight requests, latency percentiles, outcome counts and throughput."""
+        with self._condition:
+            p50, p95 = self._percentiles()
+            elapsed = time.monotonic() - self._started
+            recent = list(self._outcomes)
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'latency_p50': p50,
+                'latency_p95': p95,
+                'throttle_rate': recent.count('throttled') / len(recent) if recent else 0.0,
+                'error_rate': recent.count('failed') / len(recent) if recent else 0.0,
+                **self._counts,
+                'throughput': self._counts['completed'] / elapsed if elapsed else 0.0,
+                'decisions': len(self.decisions),
+            }
+
+class AdaptiveExecutor:
+    """Runs upstream calls concurrently under an adaptive limit, retrying throttled ones.
+
+    `map` spreads work over a thread pool while keeping results in input order and
+    pulling items lazily, so it can consume a ticker stream. Only calls wrapped in
+    `call` count against the limit, which keeps cheap work such as journal hits out
+    of the latency statistics.
+    """
+
+    def __init__(self, limiter: Optional[AdaptiveLimiter] = None, max_retries: int = 4,
+                 retry_delay: float = 1.0):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Call `fn` under the limit; throttled and transient failures back off exponentially and retry.
+
+        Raises:
+            ThrottledError: The call was still throttled after `max_retries` retries
+        """
+        for attempt in range(self.max_retries + 1):
+            started = self.limiter.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.limiter.release(started, 'throttled' if throttled else 'failed')
+                if not (throttled or is_transient(e)):
+                    raise
+                if attempt == self.max_retries:
+                    if throttled:
+                        raise ThrottledError(str(e)) from e
+                    raise
+                time.sleep(self.retry_delay * 2 ** attempt * random.uniform(0.5, 1.5))
+                continue
+            self.limiter.release(started)
+            return result
+
+    def map(self, fn: Callable[[Any], Any], items: Iterable[Any]) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """Yield (item, result, error) in input order; error is set when the item stayed throttled or unreachable.
+
+        Closing the iterator early cancels the queued items and waits only for those in flight.
+        """
+        def run(item):
+            try:
+                return fn(item), None
+            except Exception as e:
+                if isinstance(e, ThrottledError) or is_transient(e):
+                    return None, e
+                raise
+
+        iterator = iter(items)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.limiter.maximum) as pool:
+            try:
+                while True:
+                    while len(pending) < self.limiter.maximum:
+                        item = next(iterator, _DONE)
+                        if item is _DONE:
+                            break
+                        pending.append((item, pool.submit(run, item)))
+                    if not pending:
+                        break
+                    item, future = pending.popleft()
+                    result, error = future.result()
+                    yield item, result, error
+            finally:
+                # A consumer that stops early should not wait for queued work
+                for _, future in pending:
+                    future.cancel()
+
+    def decisions(self) -> List[Dict[str, Any]]:
+        """Every limit change so far, oldest first."""
+        return [asdict(d) for d in self.limiter.decisions]
+
+    def log_metrics(self) -> Dict[str, Any]:
+        """Log and return the limiter's current metrics."""
+        metrics = self.limiter.metrics()
+        logger.info("Fetch concurrency: " + ", ".join(
+            f"{k} {v:.3f}" if isinstance(v, float) else f"{k} {v}" for k, v in metrics.items()))
+        return metrics
+
+_DONE = object()
@@ -0,0 +1,84 @@
+from typing import List, Optional
+import logging
+import numpy as np
+import pandas as pd
+from market_data import PriceMatrixCache
+
+logger = logging.getLogger(__name__)
+
+GROWTH_YEARS = (1, 3, 5)
+
+def _trailing_sums(cumulative: np.ndarray, dates: pd.DatetimeIndex, end: pd.Timestamp,
+                   days: int = 365) -> np.ndarray:
+    """Per-column sum over (end - days, end] read off a cumulative sum with a leading zero row."""
+    stop = dates.searchsorted(end, side='right')
+    start = dates.searchsorted(end - pd.Timedelta(days=days), side='right')
+    return cumulative[stop] - cumulative[start]
+
+def dividend_metrics(dividends: pd.DataFrame, prices: pd.DataFrame,
+                     as_of: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    """Trailing-twelve-month dividend statistics for every column at once.
+
+    Args:
+        dividends: Date x ticker matrix of dividend cash amounts (zero on non-payment days)
+        prices: Date x ticker matrix of closes used for the yields
+        as_of: Evaluation date (last date of the matrix by default)
+
+    Returns:
+        pd.DataFrame: One row per ticker with TTM dividend, trailing and forward
+        yields, 1/3/5-year TTM dividend CAGR and the volatility of annual dividend growth
+    """
+    dates = pd.DatetimeIndex(dividends.index)
+    as_of = as_of or dates[-1]
+    values = np.nan_to_num(dividends.to_numpy(dtype=float))
+    values[dates > as_of] = 0.0
+    paid = values > 0
+
+    zero_row = np.zeros((1, values.shape[1]))
+    amounts = np.vstack([zero_row, np.cumsum(values, axis=0)])
+    counts = np.vstack([zero_row, np.cumsum(paid, axis=0)])
+
+    ttm = _trailing_sums(amounts, dates, as_of)
+    payments = _trailing_sums(counts, dates, as_of)
+
+    # Last paid amount per ticker, scanning backwards from as_of
+    last_pos = len(values) - 1 - np.argmax(paid[::-1], axis=0)
+    last_dividend = np.where(paid.any(axis=0), values[last_pos, np.arange(values.shape[1])], 0.0)
+
+    price = prices.reindex(columns=dividends.columns).loc[:as_of].ffill().iloc[-1].to_numpy(dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = pd.DataFrame({
+            'ttm_dividend': ttm,
+            'payments_ttm': payments.astype(int),
+            'ttm_yield': np.where(price > 0, ttm / price, np.nan),
+            'forward_yield': np.where(price > 0, last_dividend * payments / price, np.nan),
+        }, index=dividends.columns)
+
+        for years in GROWTH_YEARS:
+            past_end = as_of - pd.DateOffset(years=years)
+            past = _trailing_sums(amounts, dates, past_end)
+            covered = dates[0] <= past_end - pd.Timedelta(days=365)
+            growth = np.power(ttm / past, 1.0 / years) - 1
+            result[f'dividend_cagr_{years}y'] = np.where(covered & (past > 0) & (ttm > 0), growth, np.nan)
+
+    # Growth volatility over complete calendar years only
+    annual = dividends.loc[:as_of].groupby(dates[dates <= as_of].year).sum()
+    annual = annual.loc[(annual.index > dates[0].year) & (annual.index < as_of.year)]
+    growth = annual.where(annual > 0).pct_change(fill_method=None)
+    result['dividend_volatility'] = growth.std()
+
+    return result
+
+class DividendMetrics:
+    """Bulk dividend metrics for a universe, read from the shared price cache."""
+
+    def __init__(self, cache: Optional[PriceMatrixCache] = None):
+        self.cache = cache or PriceMatrixCache()
+
+    def compute(self, tickers: List[str]) -> pd.DataFrame:
+        """Refresh the cache for `tickers` and compute their TTM dividend metrics."""
+        self.cache.update(tickers)
+        dividends = self.cache.dividends.reindex(columns=tickers, fill_value=0.0)
+        prices = self.cache.prices.reindex(columns=tickers)
+        logger.info(f"Computed dividend metrics for {len(tickers)} tickers")
+        return dividend_metrics(dividends, prices)
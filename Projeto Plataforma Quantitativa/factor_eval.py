@@ -0,0 +1,173 @@
+from typing import Dict, Optional, Sequence
+import logging
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from ranking import rank_array
+from results_store import ResultsStore
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = (1, 3, 12)
+
+@dataclass
+class FactorReport:
+    """Data class to store the evaluation of one factor over its rebalance dates."""
+    factor: str
+    ic: pd.DataFrame
+    spreads: pd.DataFrame
+    quantile_returns: Dict[int, pd.DataFrame]
+    turnover: pd.Series
+    summary: pd.DataFrame
+
+def factor_panel(store: ResultsStore, strategy: str, column: str = 'Final_Rank') -> pd.DataFrame:
+    """Date x ticker panel of one stored column, keeping the last run of each day."""
+    runs = store.read(strategy, columns=['run_date', 'run_id', 'ticker', column])
+    if runs.empty:
+        return pd.DataFrame()
+    runs = runs.sort_values('run_id').drop_duplicates(['run_date', 'ticker'], keep='last')
+    panel = runs.pivot(index='run_date', columns='ticker', values=column).astype(float)
+    panel.index = pd.to_datetime(panel.index)
+    return panel
+
+def forward_returns(prices: pd.DataFrame, dates: pd.DatetimeIndex, months: int) -> pd.DataFrame:
+    """Simple return from each date to `months` later, using the last close on or before each end.
+
+    Periods ending after the last available price are NaN.
+    """
+    prices = prices.sort_index().ffill()
+    ends = dates + pd.DateOffset(months=months)
+    values = prices.to_numpy(dtype=float)
+
+    start_pos = prices.index.searchsorted(dates, side='right') - 1
+    end_pos = prices.index.searchsorted(ends, side='right') - 1
+    valid = (start_pos >= 0) & (ends <= prices.index[-1])
+
+    result = np.full((len(dates), values.shape[1]), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[valid] = values[end_pos[valid]] / values[start_pos[valid]] - 1
+    return pd.DataFrame(result, index=dates, columns=prices.columns)
+
+def _row_ranks(values: np.ndarray, pct: bool = False) -> np.ndarray:
+    """Ascending average ranks within each row, in a single batched rank pass."""
+    rows = np.repeat(np.arange(values.shape[0]), values.shape[1])
+    return rank_array(values.ravel(), rows, ascending=True, pct=pct).reshape(values.shape)
+
+def _row_correlation(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Pearson correlation of each row pair, ignoring NaN entries."""
+    count = np.sum(~np.isnan(x), axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = x - np.nansum(x, axis=1, keepdims=True) / count
+        y = y - np.nansum(y, axis=1, keepdims=True) / count
+        corr = np.nansum(x * y, axis=1) / np.sqrt(np.nansum(x * x, axis=1) * np.nansum(y * y, axis=1))
+    return np.where(count[:, 0] >= 3, corr, np.nan)
+
+def information_coefficient(factor: np.ndarray, returns: np.ndarray) -> np.ndarray:
+    """Cross-sectional Spearman IC of every row (date) at once."""
+    both = ~np.isnan(factor) & ~np.isnan(returns)
+    x = _row_ranks(np.where(both, factor, np.nan))
+    y = _row_ranks(np.where(both, returns, np.nan))
+    return _row_correlation(x, y)
+
+def quantile_buckets(factor: np.ndarray, quantiles: int = 5) -> np.ndarray:
+    """Quantile of each value within its row (1 = lowest, 0 = missing)."""
+    pct = _row_ranks(factor, pct=True)
+    return np.where(np.isnan(pct), 0, np.ceil(pct * quantiles)).astype(np.int64)
+
+def quantile_returns(buckets: np.ndarray, returns: np.ndarray, quantiles: int = 5) -> np.ndarray:
+    """Equal-weighted mean return of every quantile on every row (rows x quantiles)."""
+    valid = (buckets > 0) & ~np.isnan(returns)
+    rows = np.broadcast_to(np.arange(buckets.shape[0])[:, None], buckets.shape)
+    codes = (rows * (quantiles + 1) + buckets)[valid]
+    size = buckets.shape[0] * (quantiles + 1)
+    sums = np.bincount(codes, weights=returns[valid], minlength=size)
+    counts = np.bincount(codes, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (sums / counts).reshape(buckets.shape[0], quantiles + 1)
+    return means[:, 1:]
+
+def quantile_turnover(buckets: np.ndarray, quantile: int) -> np.ndarray:
+    """Share of names in `quantile` on each row that were not in it on the previous row."""
+    members = buckets == quantile
+    stayed = np.sum(members[1:] & members[:-1], axis=1)
+    size = np.sum(members[1:], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        turnover = 1 - stayed / size
+    return np.r_[np.nan, np.where(size > 0, turnover, np.nan)]
+
+def evaluate_factor(factor: pd.DataFrame, prices: pd.DataFrame, name: str = 'factor',
+                    ascending: bool = False, horizons: Sequence[int] = HORIZONS,
+                    quantiles: int = 5) -> FactorReport:
+    """Evaluate how well a factor predicts forward returns.
+
+    Args:
+        factor: Date x ticker factor values at each rebalance date
+        prices: Daily date x ticker adjusted closes covering the forward periods
+        name: Factor name used in the report
+        ascending: True when low values are better (e.g. ranks), as in `Factor`
+        horizons: Forward return horizons in months
+        quantiles: Number of quantile portfolios
+
+    Returns:
+        FactorReport: IC and top-minus-bottom spread per date and horizon, mean
+        quantile returns, top-quantile turnover and a summary per horizon
+    """
+    tickers = factor.columns.intersection(prices.columns)
+    if len(tickers) < len(factor.columns):
+        logger.warning(f"{name}: {len(factor.columns) - len(tickers)} tickers have no prices")
+    factor = factor[tickers].sort_index()
+    dates = pd.DatetimeIndex(factor.index)
+
+    # Orient the factor so higher is better: IC > 0 and the top quantile should win
+    values = factor.to_numpy(dtype=float)
+    values = -values if ascending else values
+    buckets = quantile_buckets(values, quantiles)
+    turnover = pd.Series(quantile_turnover(buckets, quantiles), index=dates, name='turnover')
+
+    ic, spreads, by_quantile, summary = {}, {}, {}, {}
+    for months in horizons:
+        label = f"{months}m"
+        returns = forward_returns(prices[tickers], dates, months).to_numpy()
+        ic[label] = information_coefficient(values, returns)
+        means = quantile_returns(buckets, returns, quantiles)
+        spreads[label] = means[:, -1] - means[:, 0]
+        by_quantile[months] = pd.DataFrame(means, index=dates, columns=range(1, quantiles + 1))
+
+        ic_values = ic[label][~np.isnan(ic[label])]
+        ic_std = ic_values.std(ddof=1) if len(ic_values) > 1 else np.nan
+        summary[label] = {
+            'mean_ic': ic_values.mean() if len(ic_values) else np.nan,
+            'ic_ir': ic_values.mean() / ic_std if np.isfinite(ic_std) and ic_std > 0 else np.nan,
+            'ic_t_stat': (ic_values.mean() / ic_std * np.sqrt(len(ic_values))
+                          if np.isfinite(ic_std) and ic_std > 0 else np.nan),
+            'ic_hit_rate': (ic_values > 0).mean() if len(ic_values) else np.nan,
+            'mean_spread': np.nanmean(spreads[label]) if np.isfinite(spreads[label]).any() else np.nan,
+            'mean_turnover': turnover.mean(),
+            'periods': len(ic_values),
+        }
+
+    return FactorReport(
+        factor=name,
+        ic=pd.DataFrame(ic, index=dates),
+        spreads=pd.DataFrame(spreads, index=dates),
+        quantile_returns=by_quantile,
+        turnover=turnover,
+        summary=pd.DataFrame(summary).T
+    )
+
+def evaluate_strategies(prices: pd.DataFrame, store: Optional[ResultsStore] = None,
+                        strategies: Sequence[str] = ('factor_score', 'magic_formula', 'dividends'),
+                        horizons: Sequence[int] = HORIZONS, quantiles: int = 5) -> pd.DataFrame:
+    """Evaluate the stored Final_Rank of every strategy and stack the summaries."""
+    store = store or ResultsStore()
+    summaries = []
+    for strategy in strategies:
+        panel = factor_panel(store, strategy)
+        if panel.empty:
+            logger.warning(f"No stored runs for {strategy}")
+            continue
+        report = evaluate_factor(panel, prices, strategy, ascending=True, horizons=horizons, quantiles=quantiles)
+        summaries.append(report.summary.assign(factor=strategy))
+    if not summaries:
+        return pd.DataFrame()
+    return pd.concat(summaries).rename_axis('horizon').reset_index().set_index(['factor', 'horizon'])
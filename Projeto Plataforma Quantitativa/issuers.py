@@ -0,0 +1,73 @@
+from typing import List, Dict, Iterable
+import re
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# US share classes with no structural link between symbols
+KNOWN_ISSUERS: Dict[str, str] = {
+    'GOOG': 'GOOGL',
+    'FOX': 'FOXA',
+    'NWS': 'NWSA',
+    'UA': 'UAA',
+    'LEN.B': 'LEN',
+}
+
+# B3 symbols: four-letter issuer root followed by the share class number (ABCB4, TAEE11)
+B3_PATTERN = re.compile(r'^([A-Z0-9]{4})\d{1,2}(\.SA)?$')
+# US class suffixes such as BRK.B, BRK-B or BF.B
+US_CLASS_PATTERN = re.compile(r'^([A-Z]+)[.\-][A-Z]$')
+
+def issuer_key(ticker: str) -> str:
+    """Issuer identifier shared by every listing of the same company."""
+    symbol = ticker.upper()
+    if symbol in KNOWN_ISSUERS:
+        return KNOWN_ISSUERS[symbol]
+    match = B3_PATTERN.match(symbol)
+    if match:
+        return match.group(1) + (match.group(2) or '')
+    match = US_CLASS_PATTERN.match(symbol)
+    if match:
+        return match.group(1)
+    return symbol
+
+class IssuerMap:
+    """Groups share classes by issuer so company-level data is fetched once.
+
+    The first listing of each issuer in universe order is its primary listing:
+    company-level data (statements, sector) is fetched for it and fanned out to the
+    other classes, while price-level fields stay per listing. Listings can be
+    added one at a time while a universe is streamed.
+    """
+
+    def __init__(self, tickers: Iterable[str] = ()):
+        self.listings: Dict[str, List[str]] = {}
+        self.primary: Dict[str, str] = {}
+        for ticker in tickers:
+            self.add(ticker)
+
+        duplicates = sum(len(l) - 1 for l in self.listings.values())
+        if duplicates:
+            logger.info(f"{duplicates} share classes share an issuer with another listing")
+
+    def add(self, ticker: str) -> bool:
+        """Register one listing; True if it is the first (primary) listing of its issuer."""
+        listings = self.listings.setdefault(issuer_key(ticker), [])
+        listings.append(ticker)
+        self.primary[ticker] = listings[0]
+        return len(listings) == 1
+
+    @property
+    def primaries(self) -> List[str]:
+        """One listing per issuer, in universe order."""
+        return [listings[0] for listings in self.listings.values()]
+
+    def fan_out(self, data: Dict[str, object]) -> Dict[str, object]:
+        """Copy per-primary data to every share class of the same issuer."""
+        return {ticker: data[primary] for ticker, primary in self.primary.items() if primary in data}
+
+def unique_issuers(rankings: pd.DataFrame, ticker_column: str = 'ticker') -> pd.DataFrame:
+    """Keep only the best-ranked listing of each issuer (rankings must be sorted by rank)."""
+    issuers = rankings[ticker_column].map(issuer_key)
+    return rankings[~issuers.duplicated()]
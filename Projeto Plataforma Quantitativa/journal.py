@@ -0,0 +1,106 @@
+from typing import Any, Callable, Dict, Optional
+import os
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Exception class names (anywhere in the MRO) of network failures from requests, urllib3 and curl_cffi
+TRANSIENT_NAMES = ('Timeout', 'Connection', 'ProtocolError', 'ChunkedEncodingError')
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failure may succeed on retry (network drop, timeout), so its outcome is not final."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return any(name in cls.__name__ for cls in type(error).__mro__ for name in TRANSIENT_NAMES)
+
+class JobJournal:
+    """Write-ahead journal of per-ticker results for crash-resumable universe sweeps.
+
+    Each ticker's result is committed to SQLite as soon as it completes, keyed by
+    run ID, stage and ticker. Restarting with the same run ID serves completed
+    tickers from the journal and only does the remaining work. Without a run ID
+    the journal is a pass-through and touches no database.
+
+    Only final outcomes belong in the journal: tasks must raise on transient
+    failures (see `is_transient`) instead of returning an empty result, so a
+    resumed run retries those tickers.
+    """
+
+    def __init__(self, run_id: Optional[str] = None, path: str = os.path.join('cache', 'journal.sqlite')):
+        self.run_id = run_id
+        self.path = path
+        self._lock = threading.Lock()
+        self._completed: Dict[str, Dict[str, Any]] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+
+        if run_id is None:
+            return
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'run_id TEXT, stage TEXT, ticker TEXT, payload BLOB, recorded_at REAL, '
+            'PRIMARY KEY (run_id, stage, ticker))'
+        )
+        self._connection.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self._connection is not None
+
+    def completed(self, stage: str) -> Dict[str, Any]:
+        """Results already journaled for this run and stage, by ticker."""
+        if not self.enabled:
+            return {}
+        if stage not in self._completed:
+            with self._lock:
+                # Worker threads race here on the first call; only one loads the stage
+                if stage not in self._completed:
+                    rows = self._connection.execute(
+                        'SELECT ticker, payload FROM results WHERE run_id = ? AND stage = ?',
+                        (self.run_id, stage)
+                    ).fetchall()
+                    self._completed[stage] = {ticker: pickle.loads(payload) for ticker, payload in rows}
+                    if rows:
+                        logger.info(f"Resuming run {self.run_id}: {len(rows)} tickers already done "
+                                    f"in stage '{stage}'")
+        return self._completed[stage]
+
+    def record(self, stage: str, ticker: str, result: Any) -> None:
+        """Durably store one ticker's result."""
+        if not self.enabled:
+            return
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                (self.run_id, stage, ticker, payload, time.time())
+            )
+            self._connection.commit()
+            self._completed.setdefault(stage, {})[ticker] = result
+
+    def run(self, stage: str, ticker: str, task: Callable[[], Any]) -> Any:
+        """Return the journaled result for `ticker`, or run `task` and journal it.
+
+        Exceptions raised by `task` propagate and nothing is journaled.
+        """
+        done = self.completed(stage)
+        if ticker in done:
+            return done[ticker]
+        result = task()
+        self.record(stage, ticker, result)
+        return result
+
+    def clear(self) -> None:
+        """Forget every result of this run."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._connection.execute('DELETE FROM results WHERE run_id = ?', (self.run_id,))
+            self._connection.commit()
+        self._completed = {}
@@ -0,0 +1,90 @@
+from typing import List, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+import logging
+import numpy as np
+import pandas as pd
+from market_data import PriceMatrixCache
+from universe import BATCH_SIZE, batched
+
+logger = logging.getLogger(__name__)
+
+class LiquidityFilter:
+    """Tradability prefilter on average daily dollar volume and market cap.
+
+    Both measures come from the cached price/volume matrix for the whole universe
+    at once, so it runs before any per-ticker fundamentals fetch and excluded names
+    are never fetched. Market cap is the last close times the share count the
+    pipelines recorded on earlier runs; names without a recorded share count are
+    kept until one is known.
+    """
+
+    def __init__(self, min_dollar_volume: Optional[float] = 20e6, min_market_cap: Optional[float] = None,
+                 window: int = 63, cache: Optional[PriceMatrixCache] = None):
+        self.min_dollar_volume = min_dollar_volume
+        self.min_market_cap = min_market_cap
+        self.window = window
+        self.cache = cache or PriceMatrixCache()
+
+    def dollar_volume(self, tickers: Optional[List[str]] = None) -> pd.DataFrame:
+        """Rolling average daily dollar volume, date x ticker.
+
+        Windows need at least half of `window` trading days with data.
+        """
+        prices = self.cache.prices if tickers is None else self.cache.prices.reindex(columns=tickers)
+        volumes = self.cache.volumes.reindex(index=prices.index, columns=prices.columns)
+        return (prices * volumes).rolling(self.window, min_periods=self.window // 2).mean()
+
+    def metrics(self, tickers: List[str]) -> pd.DataFrame:
+        """Latest dollar volume, market cap and exclusion reason (None if tradable) per ticker."""
+        self.cache.update(tickers)
+        adv = self.dollar_volume(tickers).iloc[-1:].reindex(columns=tickers)
+        last_close = self.cache.prices.reindex(columns=tickers).ffill().iloc[-1:]
+        market_cap = last_close * self.cache.shares.reindex(tickers).to_numpy()
+
+        table = pd.DataFrame({
+            'avg_dollar_volume': adv.to_numpy()[0] if len(adv) else np.nan,
+            'market_cap': market_cap.to_numpy()[0] if len(market_cap) else np.nan,
+        }, index=pd.Index(tickers, name='ticker'))
+
+        reason = pd.Series(None, index=table.index, dtype=object)
+        if self.min_market_cap is not None:
+            reason[table['market_cap'] < self.min_market_cap] = 'Market cap below minimum'
+        if self.min_dollar_volume is not None:
+            reason[table['avg_dollar_volume'] < self.min_dollar_volume] = 'Average daily dollar volume below minimum'
+            reason[table['avg_dollar_volume'].isna()] = 'No volume history'
+        table['exclusion_reason'] = reason
+        return table
+
+    def apply(self, tickers: List[str]) -> Tuple[List[str], Dict[str, str]]:
+        """Split the universe into tradable tickers (in order) and excluded ones.
+
+        Returns:
+            Tuple[List[str], Dict[str, str]]: Tickers to fetch, and exclusion reason by ticker
+        """
+        table = self.metrics(tickers)
+        excluded = table['exclusion_reason'].dropna()
+        logger.info(f"Liquidity filter kept {len(tickers) - len(excluded)} of {len(tickers)} tickers")
+        unknown = table['market_cap'].isna().sum()
+        if self.min_market_cap is not None and unknown:
+            logger.info(f"{unknown} tickers have no recorded share count and skip the market cap rule")
+        return [t for t in tickers if t not in excluded.index], excluded.to_dict()
+
+    def stream(self, tickers: Iterable[str], excluded: Dict[str, str],
+               batch_size: int = BATCH_SIZE) -> Iterator[str]:
+        """Filter a ticker stream batch by batch, yielding tradable tickers as each batch is checked.
+
+        Exclusion reasons are added to `excluded` as they are found. The price cache
+        is saved once when the stream ends instead of after every batch.
+        """
+        with self.cache.deferred_save():
+            for batch in batched(tickers, batch_size):
+                tradable, batch_excluded = self.apply(batch)
+                excluded.update(batch_excluded)
+                yield from tradable
+
+    def record_market_caps(self, market_caps: Mapping[str, Optional[float]]) -> None:
+        """Derive share counts from fetched market caps for the next run's size rule."""
+        caps = pd.Series(market_caps, dtype=float).dropna()
+        if caps.empty or self.cache.prices.empty:
+            return
+        last_close = self.cache.prices.reindex(columns=caps.index).ffill().iloc[-1]
+        self.cache.record_shares(caps / last_close.where(last_close > 0))
@@ -0,0 +1,155 @@
+from typing import List, Dict, Iterator, Optional
+import os
+import logging
+from contextlib import contextmanager
+import pandas as pd
+import upstream
+
+logger = logging.getLogger(__name__)
+
+# Cached matrix name -> yfinance download column
+FIELDS = {'prices': 'Close', 'volumes': 'Volume', 'dividends': 'Dividends'}
+
+class PriceMatrixCache:
+    """Date x ticker matrices of adjusted closes, volumes and dividends, cached on disk.
+
+    The first call to `update` downloads `period` of history for every ticker in
+    one batched request. Later calls only download the days after the last
+    cached date, so daily refreshes stay cheap. Share counts observed by the
+    pipelines are kept alongside, so market caps can be derived without a fetch.
+    Changes are written to disk as they happen, or once at the end of a
+    `deferred_save` block for callers that update batch by batch.
+    """
+
+    def __init__(self, cache_dir: str = 'cache', period: str = '10y'):
+        self.cache_dir = cache_dir
+        self.period = period
+        self.path = os.path.join(cache_dir, 'price_matrix.pkl')
+        self.prices = pd.DataFrame()
+        self.volumes = pd.DataFrame()
+        self.dividends = pd.DataFrame()
+        self.shares = pd.Series(dtype=float)
+        self._refreshed_on: Optional[pd.Timestamp] = None
+        self._deferred = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        """Load the cached matrices if a previous run saved all of them."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            data = pd.read_pickle(self.path)
+            if set(FIELDS) - set(data):
+                logger.warning(f"Price cache {self.path} is from an older layout, rebuilding")
+                return
+            for name in FIELDS:
+                setattr(self, name, data[name])
+            self.shares = data.get('shares', self.shares)
+        except Exception as e:
+            logger.error(f"Error reading price cache {self.path}: {e}")
+
+    def _save(self) -> None:
+        """Persist the matrices to disk."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data = {name: getattr(self, name) for name in FIELDS}
+        data['shares'] = self.shares
+        pd.to_pickle(data, self.path)
+        self._dirty = False
+
+    def _changed(self) -> None:
+        """Persist a change now, or at the end of the enclosing `deferred_save` block."""
+        self._dirty = True
+        if not self._deferred:
+            self._save()
+
+    @contextmanager
+    def deferred_save(self) -> Iterator['PriceMatrixCache']:
+        """Hold back writes inside the block and save once on exit if anything changed.
+
+        Pickling the whole cache costs far more than a batch update, so batched
+        runs should save once per run rather than once per batch. Blocks may nest.
+        """
+        self._deferred += 1
+        try:
+            yield self
+        finally:
+            self._deferred -= 1
+            if not self._deferred and self._dirty:
+                self._save()
+
+    @staticmethod
+    def _download(tickers: List[str], **kwargs) -> Dict[str, pd.DataFrame]:
+        """Download closes, volumes and dividends for several tickers in one request."""
+        data = upstream.download(tickers, auto_adjust=True, actions=True, progress=False, **kwargs)
+        if data.empty:
+            return {name: pd.DataFrame(index=pd.DatetimeIndex([])) for name in FIELDS}
+
+        index = pd.DatetimeIndex(data.index).tz_localize(None)
+        frames = {}
+        for name, column in FIELDS.items():
+            frame = data[column] if column in data else pd.DataFrame(index=data.index)
+            if isinstance(frame, pd.Series):
+                frame = frame.to_frame(tickers[0])
+            frame.index = index
+            frames[name] = frame
+        return frames
+
+    def update(self, tickers: List[str]) -> pd.DataFrame:
+        """Bring the cache up to date for the given tickers.
+
+        Args:
+            tickers: Stock symbols that must be present in the matrix
+
+        Returns:
+            pd.DataFrame: Returns of the days appended by this call (empty if none)
+        """
+        last_date = self.prices.index[-1] if not self.prices.empty else None
+        missing = [t for t in tickers if t not in self.prices.columns]
+
+        if missing:
+            logger.info(f"Downloading {self.period} of prices for {len(missing)} tickers")
+            frames = self._download(missing, period=self.period)
+            for name, frame in frames.items():
+                current = getattr(self, name)
+                setattr(self, name, current.join(frame, how='outer') if not current.empty else frame)
+
+        new_rows = 0
+        today = pd.Timestamp.today().normalize()
+        # Batched callers update many times per run; look for new days once a day
+        if last_date is not None and last_date.normalize() < today and self._refreshed_on != today:
+            self._refreshed_on = today
+            start = (last_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            frames = self._download(list(self.prices.columns), start=start)
+            # Weekends, holidays and runs before the close bring no new bar
+            dates = frames['prices'].index[frames['prices'].index > last_date] if not frames['prices'].empty else []
+            if len(dates):
+                new_rows = len(dates)
+                for name, frame in frames.items():
+                    current = getattr(self, name)
+                    rows = frame.reindex(index=dates, columns=current.columns)
+                    setattr(self, name, pd.concat([current, rows]))
+
+        if missing or new_rows:
+            for name in FIELDS:
+                frame = getattr(self, name)
+                setattr(self, name, frame[~frame.index.duplicated(keep='last')].sort_index())
+            self.dividends = self.dividends.fillna(0.0)
+            self._changed()
+
+        if new_rows == 0:
+            return pd.DataFrame(columns=self.prices.columns)
+        return self.prices.iloc[-(new_rows + 1):].pct_change(fill_method=None).iloc[1:]
+
+    def record_shares(self, shares: pd.Series) -> None:
+        """Store share counts (by ticker), replacing older values, and persist them."""
+        shares = shares.dropna()
+        if shares.empty:
+            return
+        self.shares = pd.concat([self.shares.drop(shares.index, errors='ignore'), shares.astype(float)])
+        self._changed()
+
+    def returns(self, tickers: Optional[List[str]] = None) -> pd.DataFrame:
+        """Daily simple returns for the requested tickers (all cached ones by default)."""
+        prices = self.prices if tickers is None else self.prices.reindex(columns=tickers)
+        return prices.pct_change(fill_method=None).iloc[1:]
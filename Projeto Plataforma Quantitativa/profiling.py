@@ -0,0 +1,124 @@
+from typing import List, Optional
+import time
+import logging
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised when traced memory goes over the configured budget."""
+
+@dataclass
+class StageReport:
+    """Data class to store the memory profile of one pipeline stage."""
+    stage: str
+    seconds: float
+    current_mb: float
+    peak_mb: float
+    top_allocations: List[str] = field(default_factory=list)
+
+class PipelineProfiler:
+    """Opt-in memory profiling of pipeline stages (fetch, parse, metrics, ranking).
+
+    When enabled, tracemalloc runs for the whole pipeline. Each stage records its
+    duration, the traced memory after it, its own peak, and the allocation sites
+    that grew the most. With `budget_mb` set, `check()` and every stage exit raise
+    `MemoryBudgetExceeded` with the report so far once the traced peak goes over it.
+    A cProfile dump is written to `cprofile_path` when given. A disabled profiler
+    adds no overhead.
+    """
+
+    def __init__(self, enabled: bool = False, budget_mb: Optional[float] = None, top_n: int = 10,
+                 cprofile_path: Optional[str] = None, frames: int = 5):
+        self.enabled = enabled
+        self.budget_mb = budget_mb
+        self.top_n = top_n
+        self.cprofile_path = cprofile_path
+        self.frames = frames
+        self.reports: List[StageReport] = []
+        self._profile: Optional[cProfile.Profile] = None
+
+    def start(self) -> None:
+        """Begin tracing; called once before the first stage."""
+        if not self.enabled:
+            return
+        self.reports = []
+        tracemalloc.start(self.frames)
+        if self.cprofile_path:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self) -> None:
+        """Stop tracing, log the report and write the cProfile dump."""
+        if not self.enabled or not tracemalloc.is_tracing():
+            return
+        if self._profile:
+            self._profile.disable()
+            self._profile.dump_stats(self.cprofile_path)
+            logger.info(f"cProfile stats written to {self.cprofile_path}")
+            self._profile = None
+        tracemalloc.stop()
+        logger.info(self.format_report())
+
+    @contextmanager
+    def session(self):
+        """Trace everything run inside the block (no-op when disabled)."""
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Profile the enclosed block as one pipeline stage."""
+        if not self.enabled or not tracemalloc.is_tracing():
+            yield
+            return
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            # A budget check inside the stage may already have stopped tracing
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                stats = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+                self.reports.append(StageReport(
+                    stage=name,
+                    seconds=time.time() - start_time,
+                    current_mb=current / MB,
+                    peak_mb=peak / MB,
+                    top_allocations=[str(stat) for stat in stats[:self.top_n]]
+                ))
+        self.check(name)
+
+    def check(self, context: str = '') -> None:
+        """Fail fast if traced memory has gone over the budget."""
+        if not self.enabled or self.budget_mb is None or not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        if peak / MB > self.budget_mb:
+            top = tracemalloc.take_snapshot().statistics('lineno')[:self.top_n]
+            report = self.format_report() + "\nLargest live allocations:\n" + "\n".join(f"    {t}" for t in top)
+            self.stop()
+            raise MemoryBudgetExceeded(
+                f"Traced memory peak {peak / MB:.1f} MB exceeds budget of {self.budget_mb:.1f} MB"
+                f" ({context}, current {current / MB:.1f} MB)\n{report}"
+            )
+
+    def format_report(self) -> str:
+        """Human-readable summary of all recorded stages."""
+        lines = ["\nMemory profile by stage:"]
+        for report in self.reports:
+            lines.append(f"{report.stage}: {report.seconds:.2f}s, "
+                         f"current {report.current_mb:.1f} MB, peak {report.peak_mb:.1f} MB")
+            lines.extend(f"    {allocation}" for allocation in report.top_allocations)
+        return "\n".join(lines)
@@ -0,0 +1,128 @@
+from typing import List, Optional, Sequence
+import logging
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TIE_METHODS = ('average', 'min', 'max', 'first', 'dense')
+
+@dataclass
+class Factor:
+    """One ranking factor: source column, direction and weight in the composite."""
+    column: str
+    ascending: bool = False
+    weight: float = 1.0
+    name: Optional[str] = None
+
+    @property
+    def rank_column(self) -> str:
+        return self.name or f"{self.column}_Rank"
+
+def rank_array(values: np.ndarray, groups: Optional[np.ndarray] = None, ascending: bool = False,
+               method: str = 'average', pct: bool = False) -> np.ndarray:
+    """Rank values within groups using one lexsort over the whole array.
+
+    Args:
+        values: Values to rank; NaN values get a NaN rank
+        groups: Integer group code per value (one group if None)
+        ascending: Rank 1 goes to the smallest value if True, the largest otherwise
+        method: Tie handling, one of 'average', 'min', 'max', 'first', 'dense'
+        pct: Return rank / number of ranked values in the group (distinct values for 'dense')
+
+    Returns:
+        np.ndarray: Ranks starting at 1, in the original order
+    """
+    if method not in TIE_METHODS:
+        raise ValueError(f"Unknown tie method: {method}")
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n == 0:
+        return np.empty(0)
+    groups = np.zeros(n, dtype=np.int64) if groups is None else np.asarray(groups)
+
+    missing = np.isnan(values)
+    key = np.where(missing, 0.0, values if ascending else -values)
+    order = np.lexsort((key, missing, groups))
+    sorted_groups, sorted_key, sorted_missing = groups[order], key[order], missing[order]
+
+    position = np.arange(n)
+    group_start = np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+    block_start = (group_start | np.r_[True, sorted_key[1:] != sorted_key[:-1]]
+                   | np.r_[True, sorted_missing[1:] != sorted_missing[:-1]])
+    first_in_group = np.maximum.accumulate(np.where(group_start, position, 0))
+    first_in_block = np.maximum.accumulate(np.where(block_start, position, 0))
+    ordinal = position - first_in_group + 1
+
+    if method == 'first':
+        ranks = ordinal.astype(float)
+    elif method == 'dense':
+        block_id = np.cumsum(block_start)
+        ranks = (block_id - block_id[first_in_group] + 1).astype(float)
+    else:
+        # Last position of each tie block, broadcast back to every member
+        block_id = np.cumsum(block_start) - 1
+        block_end = np.r_[np.flatnonzero(block_start)[1:], n] - 1
+        low = ordinal[first_in_block].astype(float)
+        high = (block_end[block_id] - first_in_group + 1).astype(float)
+        ranks = {'min': low, 'max': high, 'average': (low + high) / 2}[method]
+
+    ranks[sorted_missing] = np.nan
+    if pct:
+        group_id = np.cumsum(group_start) - 1
+        # Dense ranks are scaled by the number of distinct values, as in pandas
+        counted = ~sorted_missing & (block_start if method == 'dense' else True)
+        counts = np.bincount(group_id, weights=counted)
+        ranks = ranks / counts[group_id]
+
+    result = np.empty(n)
+    result[order] = ranks
+    return result
+
+def _group_codes(df: pd.DataFrame, columns: Sequence[str]) -> Optional[np.ndarray]:
+    """Integer code per row for the combination of grouping columns."""
+    if not columns:
+        return None
+    return df.groupby(list(columns), sort=False, dropna=False).ngroup().to_numpy()
+
+def composite_rank(df: pd.DataFrame, factors: List[Factor], group_by: Optional[str] = None,
+                   date_column: Optional[str] = None, method: str = 'average',
+                   pct: bool = False) -> pd.DataFrame:
+    """Rank rows on several factors and combine them into a composite ranking.
+
+    Args:
+        df: One row per ticker (and date, when `date_column` is given)
+        factors: Factors to rank on
+        group_by: Column to rank within, e.g. 'sector' for sector-neutral ranks.
+            Grouped factor ranks are converted to percentiles so groups of
+            different sizes stay comparable
+        date_column: Column whose values are ranked as separate cross-sections
+        method: Tie handling for the factor ranks
+        pct: Also return the final rank as a percentile in 'Final_Percentile'
+
+    Returns:
+        pd.DataFrame: Copy of `df` with one rank column per factor, 'Combined_Rank'
+        (weighted mean of factor ranks) and 'Final_Rank', sorted by date and rank
+    """
+    dates = [date_column] if date_column else []
+    factor_groups = _group_codes(df, dates + ([group_by] if group_by else []))
+    date_groups = _group_codes(df, dates)
+
+    result = df.copy()
+    total_weight = sum(f.weight for f in factors)
+    combined = np.zeros(len(df))
+    for factor in factors:
+        ranks = rank_array(result[factor.column].to_numpy(dtype=float), factor_groups,
+                           factor.ascending, method, pct=bool(group_by))
+        result[factor.rank_column] = ranks
+        combined += factor.weight * ranks / total_weight
+
+    result['Combined_Rank'] = combined
+    result['Final_Rank'] = rank_array(combined, date_groups, ascending=True, method='first')
+    if pct:
+        result['Final_Percentile'] = rank_array(combined, date_groups, ascending=True, method='average', pct=True)
+
+    result = result.sort_values(dates + ['Final_Rank'], kind='stable').reset_index(drop=True)
+    result['Final_Rank'] = result['Final_Rank'].astype('Int64')
+    return result
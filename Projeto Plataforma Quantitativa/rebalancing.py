@@ -0,0 +1,197 @@
+from typing import List, Optional, Sequence
+import logging
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from market_data import PriceMatrixCache
+from results_store import ResultsStore
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CostModel:
+    """Transaction cost model: half spread plus square-root market impact.
+
+    The cost of trading a weight change w in a name is
+    |w| * (half_spread + impact_coefficient * daily_vol * sqrt(|w| * portfolio_value / ADV)),
+    as a fraction of portfolio value.
+    """
+    half_spread_bps: float = 5.0
+    impact_coefficient: float = 0.1
+    portfolio_value: float = 1_000_000.0
+
+    def costs(self, trade_weights: np.ndarray, adv: Optional[np.ndarray] = None,
+              volatility: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cost of each trade; arrays of any matching (or broadcastable) shape."""
+        traded = np.abs(np.asarray(trade_weights, dtype=float))
+        rate = np.full(traded.shape, self.half_spread_bps / 1e4)
+        if adv is not None and volatility is not None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                participation = traded * self.portfolio_value / np.asarray(adv, dtype=float)
+                impact = self.impact_coefficient * np.asarray(volatility, dtype=float) * np.sqrt(participation)
+            # Names without volume or volatility history are charged the spread only
+            rate = rate + np.where(np.isfinite(impact), impact, 0.0)
+        return traded * rate
+
+def _select(ranks: np.ndarray, held: np.ndarray, size: int, hold_rank: int) -> np.ndarray:
+    """Holdings after one rebalance: keep held names ranked within `hold_rank`, fill with the best."""
+    ranked = ~np.isnan(ranks)
+    keep = held & ranked & (np.where(ranked, ranks, np.inf) <= hold_rank)
+    if keep.sum() > size:
+        kept = np.flatnonzero(keep)
+        keep[:] = False
+        keep[kept[np.argsort(ranks[kept], kind='stable')[:size]]] = True
+
+    slots = size - keep.sum()
+    candidates = np.where(ranked & ~keep, ranks, np.inf)
+    if slots > 0:
+        slots = min(slots, int(np.isfinite(candidates).sum()))
+        if slots:
+            keep[np.argpartition(candidates, slots - 1)[:slots]] = True
+    return keep
+
+def buffer_holdings(ranks: np.ndarray, size: int = 10, hold_rank: int = 15,
+                    initial: Optional[np.ndarray] = None) -> np.ndarray:
+    """Holdings on every rebalance date under the buffer rule.
+
+    Args:
+        ranks: Dates x tickers ranks (1 = best, NaN = not ranked that date)
+        size: Number of names held
+        hold_rank: A held name is kept while its rank is at most this
+        initial: Holdings before the first date (none by default)
+
+    Returns:
+        np.ndarray: Boolean dates x tickers holdings. Each date depends on the
+        previous one, so dates are walked in order with the tickers handled as arrays
+    """
+    ranks = np.asarray(ranks, dtype=float)
+    holdings = np.zeros(ranks.shape, dtype=bool)
+    held = np.zeros(ranks.shape[1], dtype=bool) if initial is None else np.asarray(initial, dtype=bool)
+    for t in range(ranks.shape[0]):
+        held = holdings[t] = _select(ranks[t], held, size, hold_rank)
+    return holdings
+
+def turnover(weights: np.ndarray, initial: Optional[np.ndarray] = None) -> np.ndarray:
+    """One-way turnover (half the sum of absolute weight changes) of every rebalance date."""
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    start = np.zeros(weights.shape[1:]) if initial is None else np.nan_to_num(initial)
+    changes = np.diff(weights, axis=0, prepend=start[None])
+    return 0.5 * np.abs(changes).sum(axis=-1)
+
+@dataclass
+class RebalanceResult:
+    """Data class to store the outcome of one rebalance."""
+    holdings: List[str]
+    trades: pd.DataFrame
+    turnover: float
+    cost: float
+
+class Rebalancer:
+    """Turns a fresh ranking into trades against the previous run's portfolio.
+
+    Held names stay while their rank is within `hold_rank`, free slots go to the
+    best-ranked new names, and the trade list carries turnover and estimated costs.
+    The previous portfolio is the 'held' column of the strategy's latest stored run
+    (its top `size` names for runs stored before buffering existed).
+    """
+
+    def __init__(self, size: int = 10, hold_rank: int = 15, cost_model: Optional[CostModel] = None,
+                 store: Optional[ResultsStore] = None, cache: Optional[PriceMatrixCache] = None,
+                 window: int = 63):
+        self.size = size
+        self.hold_rank = hold_rank
+        self.cost_model = cost_model or CostModel()
+        self.store = store or ResultsStore()
+        self.cache = cache or PriceMatrixCache()
+        self.window = window
+
+    def previous_weights(self, strategy: str) -> pd.Series:
+        """Weights of the previous portfolio by ticker (empty on the first run)."""
+        latest = self.store.latest(strategy)
+        if latest.empty:
+            return pd.Series(dtype=float)
+        if 'held' in latest:
+            held = latest[latest['held'].fillna(False).astype(bool)]
+        else:
+            held = latest[latest['Final_Rank'] <= self.size]
+        if 'weight' in held and held['weight'].notna().all():
+            weights = held.set_index('ticker')['weight'].astype(float)
+        else:
+            weights = pd.Series(1.0 / max(len(held), 1), index=held['ticker'])
+        return weights
+
+    def select(self, ranked: Sequence[str], previous: Sequence[str]) -> List[str]:
+        """New holdings, in rank order, from tickers sorted best first."""
+        ranked = list(ranked)
+        universe = pd.Index(ranked).append(pd.Index(previous).difference(ranked))
+        ranks = np.full(len(universe), np.nan)
+        ranks[:len(ranked)] = np.arange(1, len(ranked) + 1)
+        keep = _select(ranks, universe.isin(previous), self.size, self.hold_rank)
+        return [t for t in ranked if t in set(universe[keep])]
+
+    def _market_inputs(self, tickers: pd.Index):
+        """Trailing average dollar volume and daily volatility from the price cache."""
+        self.cache.update(list(tickers))
+        if self.cache.prices.empty:
+            return None, None
+        prices = self.cache.prices.reindex(columns=tickers).iloc[-(self.window + 1):]
+        volumes = self.cache.volumes.reindex(index=prices.index, columns=tickers)
+        adv = (prices * volumes).iloc[1:].mean()
+        volatility = prices.pct_change(fill_method=None).iloc[1:].std()
+        return adv.to_numpy(), volatility.to_numpy()
+
+    def trades(self, previous: pd.Series, target: pd.Series) -> pd.DataFrame:
+        """Trade list from previous to target weights, with turnover share and estimated cost."""
+        tickers = previous.index.union(target.index, sort=False)
+        before = previous.reindex(tickers).fillna(0.0)
+        after = target.reindex(tickers).fillna(0.0)
+        change = after - before
+
+        adv, volatility = self._market_inputs(tickers)
+        trades = pd.DataFrame({
+            'ticker': tickers,
+            'weight_before': before.to_numpy(),
+            'weight_after': after.to_numpy(),
+            'trade_weight': change.to_numpy(),
+            'trade_value': change.to_numpy() * self.cost_model.portfolio_value,
+            'cost': self.cost_model.costs(change.to_numpy(), adv, volatility),
+        })
+        trades['action'] = np.select(
+            [before.to_numpy() == 0, after.to_numpy() == 0, change.to_numpy() > 0, change.to_numpy() < 0],
+            ['Buy', 'Sell', 'Increase', 'Reduce'], default='Hold'
+        )
+        return trades[trades['action'] != 'Hold'].reset_index(drop=True)
+
+    @staticmethod
+    def merge_trades(table: pd.DataFrame, rebalance: RebalanceResult) -> pd.DataFrame:
+        """Add each ticker's trade weight and estimated cost to a run table."""
+        trades = rebalance.trades[['ticker', 'trade_weight', 'cost']].rename(columns={'cost': 'trade_cost'})
+        return table.merge(trades, on='ticker', how='left')
+
+    def rebalance(self, holdings: Sequence[str], weights: Optional[Sequence[float]] = None,
+                  previous: Optional[pd.Series] = None) -> RebalanceResult:
+        """Trades that move the previous portfolio to the selected holdings.
+
+        Args:
+            holdings: Tickers returned by `select`
+            weights: Target weights aligned with `holdings`; equal weights if None
+            previous: Output of `previous_weights` (no prior portfolio if None)
+
+        Returns:
+            RebalanceResult: Holdings, trade list, one-way turnover and total cost
+        """
+        holdings = list(holdings)
+        if weights is None:
+            weights = np.full(len(holdings), 1.0 / max(len(holdings), 1))
+        previous = pd.Series(dtype=float) if previous is None else previous
+        trades = self.trades(previous, pd.Series(np.asarray(weights, dtype=float), index=holdings))
+        result = RebalanceResult(
+            holdings=holdings,
+            trades=trades,
+            turnover=0.5 * trades['trade_weight'].abs().sum(),
+            cost=trades['cost'].sum()
+        )
+        logger.info(f"\nRebalance: turnover {result.turnover:.1%}, estimated cost {result.cost * 1e4:.1f} bps")
+        if not trades.empty:
+            logger.info(f"\n{trades.round(4).to_string(index=False)}")
+        return result
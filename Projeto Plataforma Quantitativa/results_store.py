@@ -0,0 +1,124 @@
+from typing import List, Optional, Any
+import os
+import uuid
+import logging
+from dataclasses import asdict
+from datetime import datetime, date, timedelta
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+logger = logging.getLogger(__name__)
+
+PARTITIONING = ds.partitioning(pa.schema([('run_date', pa.string())]), flavor='hive')
+
+class ResultsStore:
+    """Parquet dataset of full run outputs, partitioned by strategy and run_date.
+
+    Layout: <root>/strategy=<name>/run_date=<YYYY-MM-DD>/<run_id>.parquet, one
+    file per run with a row per ticker (rankings, metrics and exclusion reasons).
+    Run IDs are the run time to the microsecond plus a random token, so they sort
+    chronologically and two runs never share a file.
+    Reads go through a memory-mapped filesystem and only load the requested columns.
+    """
+
+    def __init__(self, root: str = 'results'):
+        self.root = root
+        self.filesystem = fs.LocalFileSystem(use_mmap=True)
+
+    @staticmethod
+    def build_table(results: List[Any], rankings: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """Combine per-ticker result dataclasses with the ranking columns.
+
+        Args:
+            results: StockResult/DividendResult instances for every analyzed ticker
+            rankings: Output of prepare_rankings (included tickers only)
+
+        Returns:
+            pd.DataFrame: One row per ticker, with 'exclusion_reason' for excluded ones
+        """
+        table = pd.DataFrame([asdict(r) for r in results])
+        table['exclusion_reason'] = table.pop('missing_data').map(lambda m: '; '.join(map(str, m)) or None)
+        if rankings is not None:
+            rank_columns = [c for c in rankings.columns if c.endswith('_Rank') or c == 'ticker']
+            table = table.merge(rankings[rank_columns], on='ticker', how='left')
+        return table
+
+    def write_run(self, strategy: str, table: pd.DataFrame, run_time: Optional[datetime] = None) -> str:
+        """Write one run's table and return the file path."""
+        run_time = run_time or datetime.now()
+        directory = os.path.join(self.root, f"strategy={strategy}", f"run_date={run_time:%Y-%m-%d}")
+        os.makedirs(directory, exist_ok=True)
+        run_id = f"{run_time:%Y%m%dT%H%M%S.%f}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(directory, f"{run_id}.parquet")
+
+        table = table.assign(run_id=run_id)
+        # Integer columns turn into floats whenever a run has a missing value; store
+        # them as floats always so every run of a strategy shares one schema
+        integers = [c for c in table.columns
+                    if pd.api.types.is_integer_dtype(table[c]) and not pd.api.types.is_bool_dtype(table[c])]
+        table = table.astype({c: 'float64' for c in integers})
+        pq.write_table(pa.Table.from_pandas(table, preserve_index=False), path, compression='zstd')
+        logger.info(f"Saved {len(table)} rows for {strategy} to {path}")
+        return path
+
+    def _dataset(self, strategy: str) -> Optional[ds.Dataset]:
+        directory = os.path.join(self.root, f"strategy={strategy}")
+        if not os.path.isdir(directory):
+            return None
+        dataset = ds.dataset(directory, format='parquet', partitioning=PARTITIONING, filesystem=self.filesystem)
+        # Columns may be added over time (e.g. weights) and runs written before float
+        # columns were enforced may hold ints; read with the promoted union of all schemas
+        schema = pa.unify_schemas([f.physical_schema for f in dataset.get_fragments()] + [PARTITIONING.schema],
+                                  promote_options='permissive')
+        return ds.dataset(directory, schema=schema, format='parquet', partitioning=PARTITIONING,
+                          filesystem=self.filesystem)
+
+    def read(self, strategy: str, tickers: Optional[List[str]] = None, start: Optional[date] = None,
+             end: Optional[date] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read stored runs, filtering by ticker and run date before loading.
+
+        Args:
+            strategy: Strategy name used when writing
+            tickers: Restrict to these tickers
+            start: First run date included
+            end: Last run date included
+            columns: Columns to load (all by default)
+
+        Returns:
+            pd.DataFrame: Matching rows, empty if nothing was stored
+        """
+        dataset = self._dataset(strategy)
+        if dataset is None:
+            return pd.DataFrame(columns=columns)
+
+        condition = None
+        filters = []
+        if tickers is not None:
+            filters.append(ds.field('ticker').isin(tickers))
+        if start is not None:
+            filters.append(ds.field('run_date') >= start.isoformat())
+        if end is not None:
+            filters.append(ds.field('run_date') <= end.isoformat())
+        for f in filters:
+            condition = f if condition is None else condition & f
+
+        return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+    def rank_history(self, strategy: str, ticker: str, years: int = 2) -> pd.DataFrame:
+        """Final rank of one ticker across stored runs of the last `years` years."""
+        start = date.today() - timedelta(days=365 * years)
+        history = self.read(strategy, [ticker], start=start,
+                            columns=['run_date', 'run_id', 'status', 'Final_Rank'])
+        return history.sort_values('run_id').reset_index(drop=True)
+
+    def latest(self, strategy: str) -> pd.DataFrame:
+        """Full table of the most recent stored run."""
+        dataset = self._dataset(strategy)
+        if dataset is None:
+            return pd.DataFrame()
+        run_ids = dataset.to_table(columns=['run_id']).column('run_id')
+        last = max(run_ids.to_pylist())
+        return dataset.to_table(filter=ds.field('run_id') == last).to_pandas()
@@ -0,0 +1,184 @@
+from typing import List, Dict, Optional
+from statistics import NormalDist
+import logging
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from market_data import PriceMatrixCache
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+
+def _window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of every trailing window along axis 0 via a cumulative sum."""
+    csum = np.cumsum(values, axis=0)
+    csum = np.vstack([np.zeros((1,) + values.shape[1:]), csum])
+    return csum[window:] - csum[:-window]
+
+def _chunks(total: int, per_row: int, budget: int = 2_000_000):
+    """Yield slices over `total` rows so each chunk holds about `budget` elements."""
+    step = max(1, budget // max(per_row, 1))
+    for start in range(0, total, step):
+        yield slice(start, min(start + step, total))
+
+def _rolling_drawdown(log_wealth: np.ndarray, span: int) -> np.ndarray:
+    """Deepest log drawdown over every run of `span` consecutive wealth levels.
+
+    Builds per-block (max, min, drawdown) triples by doubling the block length and
+    joins blocks with drawdown(a + b) = min(dd_a, dd_b, min_b - max_a), so the cost
+    is O(T * N * log span) instead of O(T * N * span).
+    """
+    def join(left, right, offset):
+        hi_l, lo_l, dd_l = left
+        hi_r, lo_r, dd_r = (part[offset:] for part in right)
+        size = len(hi_r)
+        return (np.maximum(hi_l[:size], hi_r), np.minimum(lo_l[:size], lo_r),
+                np.minimum(np.minimum(dd_l[:size], dd_r), lo_r - hi_l[:size]))
+
+    block = (log_wealth, log_wealth, np.zeros_like(log_wealth))
+    result, length, covered = None, 1, 0
+    remaining = span
+    while remaining:
+        if remaining & 1:
+            result = block if result is None else join(result, block, covered)
+            covered += length
+        remaining >>= 1
+        if remaining:
+            block = join(block, block, length)
+            length *= 2
+    return result[2][:len(log_wealth) - span + 1]
+
+class RiskEngine:
+    """Rolling risk metrics for a date x ticker return matrix.
+
+    Moments, volatility and beta come from cumulative sums, so their cost does not
+    depend on the window length. Historical quantiles partition strided window
+    views in ticker chunks to keep memory bounded, and drawdowns are merged from
+    doubling blocks. Windows that contain a missing return produce NaN.
+    """
+
+    def __init__(self, returns: pd.DataFrame, benchmark: Optional[pd.Series] = None):
+        self.returns = returns
+        self.benchmark = benchmark.reindex(returns.index) if benchmark is not None else None
+
+    @classmethod
+    def from_cache(cls, tickers: List[str], cache: Optional[PriceMatrixCache] = None,
+                   benchmark: str = 'SPY') -> 'RiskEngine':
+        """Build an engine from the shared price cache, using SPY as benchmark."""
+        cache = cache or PriceMatrixCache()
+        cache.update(list(tickers) + [benchmark])
+        returns = cache.returns(list(tickers) + [benchmark])
+        return cls(returns[tickers], returns[benchmark])
+
+    def _prepare(self, window: int):
+        """Dense values, window index and the mask of windows with missing data."""
+        values = self.returns.to_numpy(dtype=float)
+        if len(values) < window:
+            raise ValueError(f"Need at least {window} observations, got {len(values)}")
+        missing = _window_sums(np.isnan(values).astype(float), window) > 0
+        return np.nan_to_num(values), self.returns.index[window - 1:], missing
+
+    def _frame(self, data: np.ndarray, index: pd.Index, missing: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(np.where(missing, np.nan, data), index=index, columns=self.returns.columns)
+
+    def volatility(self, window: int = TRADING_DAYS) -> pd.DataFrame:
+        """Annualized rolling volatility."""
+        values, index, missing = self._prepare(window)
+        mean = _window_sums(values, window) / window
+        var = (_window_sums(values ** 2, window) - window * mean ** 2) / (window - 1)
+        return self._frame(np.sqrt(np.maximum(var, 0) * TRADING_DAYS), index, missing)
+
+    def beta(self, window: int = TRADING_DAYS) -> pd.DataFrame:
+        """Rolling beta of each series to the benchmark."""
+        if self.benchmark is None:
+            raise ValueError("A benchmark series is required for beta")
+        values, index, missing = self._prepare(window)
+        market = self.benchmark.to_numpy(dtype=float)[:, None]
+        missing = missing | (_window_sums(np.isnan(market).astype(float), window) > 0)
+        market = np.nan_to_num(market)
+
+        sum_x, sum_m = _window_sums(values, window), _window_sums(market, window)
+        cov = _window_sums(values * market, window) - sum_x * sum_m / window
+        var = _window_sums(market ** 2, window) - sum_m ** 2 / window
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._frame(cov / var, index, missing)
+
+    def parametric_var(self, window: int = TRADING_DAYS, alpha: float = 0.05) -> Dict[str, pd.DataFrame]:
+        """Gaussian one-day VaR and CVaR, reported as positive losses."""
+        values, index, missing = self._prepare(window)
+        mean = _window_sums(values, window) / window
+        std = np.sqrt(np.maximum((_window_sums(values ** 2, window) - window * mean ** 2) / (window - 1), 0))
+        z = NormalDist().inv_cdf(alpha)
+        var = -(mean + z * std)
+        cvar = -(mean - std * NormalDist().pdf(z) / alpha)
+        return {'VaR': self._frame(var, index, missing), 'CVaR': self._frame(cvar, index, missing)}
+
+    def historical_var(self, window: int = TRADING_DAYS, alpha: float = 0.05) -> Dict[str, pd.DataFrame]:
+        """Historical one-day VaR and CVaR, reported as positive losses."""
+        values, index, missing = self._prepare(window)
+        # Ticker-major layout keeps each window contiguous for the partition
+        views = sliding_window_view(np.ascontiguousarray(values.T), window, axis=1)
+        k = max(int(np.floor(alpha * window)) - 1, 0)
+        var = np.empty(views.shape[:2])
+        cvar = np.empty(views.shape[:2])
+
+        for rows in _chunks(len(views), views.shape[1] * window):
+            tail = np.partition(views[rows], k, axis=-1)[..., :k + 1]
+            var[rows] = -tail[..., k]
+            cvar[rows] = -tail.mean(axis=-1)
+        return {'VaR': self._frame(var.T, index, missing), 'CVaR': self._frame(cvar.T, index, missing)}
+
+    def max_drawdown(self, window: int = TRADING_DAYS) -> pd.DataFrame:
+        """Worst peak-to-trough loss inside each rolling window, as a positive fraction."""
+        values, index, missing = self._prepare(window)
+        log_wealth = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(np.log1p(values), axis=0)])
+        # Each window also needs the wealth level before its first return
+        drawdown = _rolling_drawdown(log_wealth, window + 1)
+        return self._frame(-np.expm1(drawdown), index, missing)
+
+    def rolling_metrics(self, window: int = TRADING_DAYS, alpha: float = 0.05) -> Dict[str, pd.DataFrame]:
+        """All rolling metrics keyed by name, each a date x ticker frame."""
+        historical = self.historical_var(window, alpha)
+        parametric = self.parametric_var(window, alpha)
+        metrics = {
+            'volatility': self.volatility(window),
+            'hist_VaR': historical['VaR'],
+            'hist_CVaR': historical['CVaR'],
+            'param_VaR': parametric['VaR'],
+            'param_CVaR': parametric['CVaR'],
+            'max_drawdown': self.max_drawdown(window),
+        }
+        if self.benchmark is not None:
+            metrics['beta'] = self.beta(window)
+        return metrics
+
+    def with_portfolio(self, weights: pd.Series, name: str = 'Portfolio') -> 'RiskEngine':
+        """Engine over the constituents plus their daily-rebalanced portfolio."""
+        constituents = self.returns[weights.index]
+        portfolio = constituents.fillna(0).to_numpy() @ weights.to_numpy()
+        returns = constituents.assign(**{name: portfolio})
+        return RiskEngine(returns, self.benchmark)
+
+    def latest(self, window: int = TRADING_DAYS, alpha: float = 0.05) -> pd.DataFrame:
+        """Most recent value of every rolling metric, one row per series."""
+        metrics = self.rolling_metrics(window, alpha)
+        return pd.DataFrame({name: frame.iloc[-1] for name, frame in metrics.items()})
+
+def portfolio_risk_report(tickers: List[str], weights: Optional[np.ndarray] = None,
+                          cache: Optional[PriceMatrixCache] = None, window: int = TRADING_DAYS) -> pd.DataFrame:
+    """Latest rolling risk metrics for a portfolio and its constituents.
+
+    Args:
+        tickers: Portfolio constituents
+        weights: Position weights in the order of `tickers` (equal weights by default)
+        cache: Shared price cache
+        window: Rolling window length in trading days
+
+    Returns:
+        pd.DataFrame: One row per constituent plus a 'Portfolio' row
+    """
+    if weights is None:
+        weights = np.full(len(tickers), 1.0 / len(tickers))
+    engine = RiskEngine.from_cache(tickers, cache)
+    return engine.with_portfolio(pd.Series(np.asarray(weights, dtype=float), index=tickers)).latest(window)
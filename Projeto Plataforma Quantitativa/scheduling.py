@@ -0,0 +1,145 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+import logging
+import numpy as np
+import pandas as pd
+from issuers import issuer_key
+from results_store import ResultsStore
+
+logger = logging.getLogger(__name__)
+
+def score_history(store: ResultsStore, strategy: str, column: str = 'score') -> pd.DataFrame:
+    """Non-null scores of every stored run, oldest first (empty if none were stored)."""
+    history = store.read(strategy, columns=['run_id', 'ticker', column])
+    if history.empty or column not in history:
+        return pd.DataFrame(columns=['run_id', 'ticker', column])
+    return history.dropna(subset=[column]).sort_values('run_id')
+
+def drift_bound(residuals: np.ndarray, quantile: float = 1.0) -> float:
+    """`quantile` of the absolute estimate errors, the largest one by default.
+
+    Infinite without any error observed yet, so nothing is bounded on the first runs.
+    """
+    residuals = np.abs(np.asarray(residuals, dtype=float))
+    residuals = residuals[~np.isnan(residuals)]
+    return float(np.quantile(residuals, quantile)) if residuals.size else np.inf
+
+def score_drift(history: pd.DataFrame, column: str = 'score', quantile: float = 1.0) -> float:
+    """`quantile` of the absolute score change of a ticker between consecutive runs.
+
+    These are the errors of using the last score as the estimate of the next one.
+    Infinite until two runs scored the same ticker.
+    """
+    if history.empty:
+        return np.inf
+    panel = history.pivot_table(index='run_id', columns='ticker', values=column, aggfunc='last').sort_index()
+    return drift_bound(np.diff(panel.to_numpy(dtype=float), axis=0).ravel(), quantile)
+
+class TopKScheduler:
+    """Fetch order and early stop for screens where only the top `k` issuers matter.
+
+    Each ticker's score is bounded by its estimate (the last known score by
+    default) plus `drift`, the `quantile` of the past errors of that same estimate
+    (when not given); tickers without an estimate are unbounded. Fetches go in
+    descending order of that bound, tickers that must be fetched (e.g. current
+    holdings) and unbounded ones first. Fetching stops once the k-th best issuer
+    score is at least the best bound left minus `tolerance`.
+
+    With `tolerance=0` and `quantile=1` (the largest error observed so far) no
+    unfetched ticker can enter the top k unless its score moves further from its
+    estimate than any move seen in the stored runs. A lower quantile or a positive
+    tolerance trades that guarantee for fewer fetches; with `quantile=0.99` about
+    1% of moves exceed the bound. `k` must be at least the portfolio size, and the
+    rebalancer's `hold_rank` when buffering, since held names are kept down to
+    that rank.
+    """
+
+    def __init__(self, k: int = 10, tolerance: float = 0.0, drift: Optional[float] = None,
+                 store: Optional[ResultsStore] = None, quantile: float = 1.0):
+        self.k = k
+        self.tolerance = tolerance
+        self.drift = drift
+        self.store = store or ResultsStore()
+        self.quantile = quantile
+        self.order: List[str] = []
+        self.bounds = np.empty(0)
+        self.best: Dict[str, float] = {}
+        self.position = 0
+
+    def plan(self, strategy: str, tickers: Iterable[str], required: Iterable[str] = (),
+             estimates: Optional[pd.Series] = None, residuals: Optional[np.ndarray] = None,
+             column: str = 'score') -> List[str]:
+        """Order `tickers` for fetching.
+
+        Args:
+            strategy: Strategy whose stored runs give the last known scores and their drift
+            tickers: Universe to fetch
+            required: Tickers fetched first regardless of their bound
+            estimates: Cheap score estimates (higher is better) used instead of the
+                last known scores
+            residuals: Past errors (actual minus estimate) of the estimator behind
+                `estimates`, which size the drift; without them the drift is measured
+                on the changes of the last known score, the default estimate
+            column: Score column of the stored runs
+
+        Returns:
+            List[str]: Tickers in fetch order
+        """
+        history = score_history(self.store, strategy, column)
+        if estimates is None:
+            estimates = history.groupby('ticker')[column].last()
+        if self.drift is not None:
+            drift = self.drift
+        elif residuals is not None:
+            drift = drift_bound(residuals, self.quantile)
+        else:
+            drift = score_drift(history, column, self.quantile)
+
+        tickers = pd.Index(list(dict.fromkeys(tickers)))
+        bounds = estimates.reindex(tickers).to_numpy(dtype=float) + drift
+        bounds[np.isnan(bounds) | tickers.isin(list(required))] = np.inf
+        order = np.argsort(-bounds, kind='stable')
+
+        self.order = tickers[order].tolist()
+        self.bounds = bounds[order]
+        self.best = {}
+        self.position = 0
+        bounded = np.isfinite(self.bounds).sum()
+        logger.info(f"Fetch plan: {len(self.order) - bounded} required or unscored tickers first, "
+                    f"{bounded} bounded by last score + {drift:.4g}")
+        return self.order
+
+    def observe(self, ticker: str, score: Optional[float]) -> None:
+        """Record the next fetched ticker in plan order (None if it could not be scored)."""
+        self.position += 1
+        if score is not None and not np.isnan(score):
+            key = issuer_key(ticker)
+            self.best[key] = max(score, self.best.get(key, -np.inf))
+
+    def kth_score(self) -> float:
+        """Score of the k-th best issuer fetched so far (-inf until k issuers are scored)."""
+        if len(self.best) < self.k:
+            return -np.inf
+        return float(np.partition(np.fromiter(self.best.values(), float), -self.k)[-self.k])
+
+    def settled(self) -> bool:
+        """Whether no unfetched ticker can still enter the top k (within `tolerance`)."""
+        if self.position >= len(self.order):
+            return True
+        return self.kth_score() >= self.bounds[self.position] - self.tolerance
+
+    def pending(self) -> Iterator[str]:
+        """Planned tickers in order, ending once the top k is settled.
+
+        Meant as the input of a concurrent fetch: items already handed out before
+        the stop still complete and should be observed, so every fetched ticker
+        is recorded and only the ones never handed out remain `unfetched`.
+        """
+        for ticker in self.order:
+            if self.settled():
+                return
+            yield ticker
+
+    @property
+    def unfetched(self) -> List[str]:
+        """Planned tickers not fetched yet."""
+        return self.order[self.position:]
@@ -0,0 +1,159 @@
+from typing import Dict, Optional, Sequence
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from market_data import PriceMatrixCache
+from results_store import ResultsStore
+from rebalancing import Rebalancer
+from risk import TRADING_DAYS
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SimulationResult:
+    """Data class to store the simulated outcomes of every path."""
+    terminal_wealth: pd.DataFrame
+    max_drawdown: pd.DataFrame
+    summary: pd.DataFrame
+
+def portfolio_returns(portfolios: Dict[str, pd.Series], cache: Optional[PriceMatrixCache] = None,
+                      benchmark: str = 'SPY') -> pd.DataFrame:
+    """Daily returns of daily-rebalanced portfolios and the benchmark.
+
+    Args:
+        portfolios: Weights by ticker for each portfolio name
+        cache: Shared price cache
+        benchmark: Benchmark ticker, returned as its own column
+
+    Returns:
+        pd.DataFrame: Date x (portfolios + benchmark), over the dates where every
+        constituent has a return
+    """
+    cache = cache or PriceMatrixCache()
+    tickers = sorted({t for weights in portfolios.values() for t in weights.index} | {benchmark})
+    cache.update(tickers)
+    returns = cache.returns(tickers)
+
+    columns = {}
+    for name, weights in portfolios.items():
+        constituents = returns[weights.index]
+        columns[name] = (constituents * weights.to_numpy()).sum(axis=1, min_count=1).where(
+            constituents.notna().all(axis=1))
+    columns[benchmark] = returns[benchmark]
+    return pd.DataFrame(columns).dropna()
+
+def latest_portfolios(strategies: Sequence[str] = ('factor_score', 'magic_formula', 'dividends'),
+                      store: Optional[ResultsStore] = None) -> Dict[str, pd.Series]:
+    """Held weights of each strategy's latest stored run (strategies without runs are skipped)."""
+    rebalancer = Rebalancer(store=store)
+    portfolios = {}
+    for strategy in strategies:
+        weights = rebalancer.previous_weights(strategy)
+        if weights.empty:
+            logger.warning(f"No stored runs for {strategy}")
+        else:
+            portfolios[strategy] = weights
+    return portfolios
+
+_returns: Optional[np.ndarray] = None
+
+def _init_worker(returns: np.ndarray) -> None:
+    """Receive the return matrix once per worker process."""
+    global _returns
+    _returns = returns
+
+def _simulate_chunk(seed: np.random.SeedSequence, paths: int, horizon: int, block: int,
+                    returns: Optional[np.ndarray] = None) -> tuple:
+    """Terminal wealth and max drawdown of every series on one chunk of paths.
+
+    Paths are built from moving blocks of `block` consecutive days, so
+    autocorrelation and cross-correlation within a block are kept.
+    """
+    returns = _returns if returns is None else returns
+    rng = np.random.default_rng(seed)
+    blocks = -(-horizon // block)
+    starts = rng.integers(0, len(returns) - block + 1, size=(paths, blocks))
+    rows = (starts[:, :, None] + np.arange(block)).reshape(paths, -1)[:, :horizon]
+
+    log_wealth = np.cumsum(np.log1p(returns[rows]), axis=1)
+    terminal = np.exp(log_wealth[:, -1])
+    peak = np.maximum(np.maximum.accumulate(log_wealth, axis=1), 0.0)
+    drawdown = np.expm1((log_wealth - peak).min(axis=1))
+    return terminal, drawdown
+
+class BootstrapSimulator:
+    """Block-bootstrap Monte Carlo of portfolio outcomes against a benchmark.
+
+    Paths are generated in chunks sized so one chunk's resampled returns stay
+    within `budget` floats. Every chunk draws from its own child of
+    `SeedSequence(seed)`, so results are reproducible and do not depend on how
+    chunks are spread over the `workers` processes.
+    """
+
+    def __init__(self, returns: pd.DataFrame, benchmark: str = 'SPY', block: int = 21,
+                 seed: Optional[int] = None, workers: Optional[int] = None, budget: int = 5_000_000):
+        if benchmark not in returns:
+            raise ValueError(f"Benchmark {benchmark} not in the return matrix")
+        if len(returns) < block:
+            raise ValueError(f"Need at least {block} observations, got {len(returns)}")
+        self.returns = returns
+        self.benchmark = benchmark
+        self.block = block
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        self.budget = budget
+
+    def run(self, paths: int = 100_000, horizon: int = TRADING_DAYS) -> SimulationResult:
+        """Simulate `paths` paths of `horizon` trading days.
+
+        Returns:
+            SimulationResult: Terminal wealth and max drawdown per path and series,
+            and a summary with wealth percentiles, drawdowns and the probability
+            of ending below the benchmark
+        """
+        values = self.returns.to_numpy(dtype=float)
+        per_chunk = max(1, self.budget // (horizon * values.shape[1]))
+        sizes = [min(per_chunk, paths - start) for start in range(0, paths, per_chunk)]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(sizes))
+        logger.info(f"Simulating {paths} paths in {len(sizes)} chunks on {self.workers} workers")
+
+        tasks = [(seed, size, horizon, self.block) for seed, size in zip(seeds, sizes)]
+        if self.workers == 1 or len(tasks) == 1:
+            chunks = [_simulate_chunk(*task, returns=values) for task in tasks]
+        else:
+            with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(values,)) as pool:
+                chunks = list(pool.map(_simulate_chunk, *zip(*tasks)))
+
+        terminal = pd.DataFrame(np.concatenate([c[0] for c in chunks]), columns=self.returns.columns)
+        drawdown = pd.DataFrame(np.concatenate([c[1] for c in chunks]), columns=self.returns.columns)
+        return SimulationResult(terminal, drawdown, self._summary(terminal, drawdown))
+
+    def _summary(self, terminal: pd.DataFrame, drawdown: pd.DataFrame) -> pd.DataFrame:
+        below = terminal.lt(terminal[self.benchmark], axis=0)
+        summary = pd.DataFrame({
+            'wealth_mean': terminal.mean(),
+            'wealth_p5': terminal.quantile(0.05),
+            'wealth_median': terminal.median(),
+            'wealth_p95': terminal.quantile(0.95),
+            'drawdown_median': drawdown.median(),
+            'drawdown_p5': drawdown.quantile(0.05),
+            'prob_loss': (terminal < 1).mean(),
+            'prob_below_benchmark': below.mean(),
+        })
+        summary.loc[self.benchmark, 'prob_below_benchmark'] = np.nan
+        return summary
+
+def simulate_strategies(paths: int = 100_000, horizon: int = TRADING_DAYS, seed: Optional[int] = None,
+                        workers: Optional[int] = None, cache: Optional[PriceMatrixCache] = None,
+                        store: Optional[ResultsStore] = None) -> pd.DataFrame:
+    """Simulate the latest factor, Magic Formula and dividend portfolios against SPY."""
+    portfolios = latest_portfolios(store=store)
+    if not portfolios:
+        return pd.DataFrame()
+    returns = portfolio_returns(portfolios, cache)
+    result = BootstrapSimulator(returns, seed=seed, workers=workers).run(paths, horizon)
+    logger.info(f"\nSimulated {horizon}-day outcomes:\n{result.summary.round(4).to_string()}")
+    return result.summary
@@ -0,0 +1,127 @@
+from typing import List, Dict, Iterable
+import logging
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+logger = logging.getLogger(__name__)
+
+# Canonical line item -> Yahoo row labels, in order of preference
+LINE_ITEMS: Dict[str, List[str]] = {
+    'EBIT': ['EBIT', 'Operating Income'],
+    'Total_Assets': ['Total Assets'],
+    'Current_Assets': ['Current Assets', 'Total Current Assets'],
+    'Current_Liabilities': ['Current Liabilities', 'Total Current Liabilities'],
+    'Total_Debt': ['Total Debt'],
+    'Total_Cash': ['Cash Cash Equivalents And Short Term Investments', 'Cash And Cash Equivalents'],
+}
+
+# Income statement items are summed over four quarters for TTM; the rest are balances
+FLOW_ITEMS = ('EBIT',)
+
+STATEMENT_KINDS = {
+    'annual': ('income_stmt', 'balance_sheet'),
+    'quarterly': ('quarterly_income_stmt', 'quarterly_balance_sheet'),
+}
+
+def fetch_statements(stock: yf.Ticker) -> Dict[str, pd.DataFrame]:
+    """Download annual and quarterly statements, each as one labels x period-end frame."""
+    statements = {}
+    for frequency, (income_attr, balance_attr) in STATEMENT_KINDS.items():
+        frames = [getattr(stock, income_attr), getattr(stock, balance_attr)]
+        frames = [f for f in frames if f is not None and not f.empty]
+        if not frames:
+            statements[frequency] = pd.DataFrame()
+            continue
+        combined = pd.concat(frames)
+        statements[frequency] = combined[~combined.index.duplicated()]
+    return statements
+
+def resolve_line_items(labels: Iterable[str]) -> Dict[str, List[str]]:
+    """Map each canonical item to the candidate labels that occur anywhere in the run."""
+    available = set(labels)
+    return {item: [c for c in candidates if c in available] for item, candidates in LINE_ITEMS.items()}
+
+class StatementPanel:
+    """Ticker x period x line item array of financial statement values.
+
+    Period 0 is the most recent statement of each ticker, so period positions line
+    up across tickers even when fiscal year ends differ. Missing values are NaN.
+    """
+
+    def __init__(self, tickers: List[str], items: List[str], values: np.ndarray, period_ends: np.ndarray):
+        self.tickers = tickers
+        self.items = items
+        self.values = values
+        self.period_ends = period_ends
+        self._item_index = {item: i for i, item in enumerate(items)}
+
+    @classmethod
+    def build(cls, statements: Dict[str, pd.DataFrame], max_periods: int = 5) -> 'StatementPanel':
+        """Stack per-ticker statements into a panel.
+
+        Args:
+            statements: Ticker -> labels x period-end frame (as from `fetch_statements`)
+            max_periods: Number of most recent periods kept per ticker
+
+        Returns:
+            StatementPanel: Panel over the canonical line items
+        """
+        tickers = list(statements)
+        # Label resolution happens once for the whole run, not per ticker
+        resolved = resolve_line_items(set().union(*(frame.index for frame in statements.values())))
+        labels = [label for candidates in resolved.values() for label in candidates]
+
+        raw = np.full((len(tickers), max_periods, len(labels)), np.nan)
+        period_ends = np.full((len(tickers), max_periods), np.datetime64('NaT'), dtype='datetime64[ns]')
+        for i, frame in enumerate(statements.values()):
+            if frame.empty:
+                continue
+            frame = frame.reindex(columns=sorted(frame.columns, reverse=True)[:max_periods])
+            block = frame.reindex(labels).to_numpy(dtype=float).T
+            raw[i, :len(block)] = block
+            period_ends[i, :len(block)] = pd.DatetimeIndex(frame.columns).tz_localize(None).to_numpy()
+
+        # Coalesce candidate labels into one column per canonical item
+        values = np.full((len(tickers), max_periods, len(LINE_ITEMS)), np.nan)
+        position = 0
+        for j, candidates in enumerate(resolved.values()):
+            for offset in range(len(candidates)):
+                column = raw[..., position + offset]
+                values[..., j] = np.where(np.isnan(values[..., j]), column, values[..., j])
+            position += len(candidates)
+
+        return cls(tickers, list(LINE_ITEMS), values, period_ends)
+
+    def item(self, name: str) -> np.ndarray:
+        """Ticker x period array for one line item."""
+        return self.values[..., self._item_index[name]]
+
+    def latest(self) -> pd.DataFrame:
+        """Most recent statement values, one row per ticker."""
+        return pd.DataFrame(self.values[:, 0, :], index=self.tickers, columns=self.items)
+
+    def ttm(self) -> pd.DataFrame:
+        """Trailing-twelve-month values from a quarterly panel.
+
+        Flow items are the sum of the last four quarters and are NaN unless all four
+        exist and span roughly one year; balance items come from the latest quarter.
+        """
+        if self.values.shape[1] < 4:
+            raise ValueError("TTM aggregation needs a panel with at least four quarters")
+        result = self.values[:, 0, :].copy()
+        span = (self.period_ends[:, 0] - self.period_ends[:, 3]) / np.timedelta64(1, 'D')
+        consistent = span < 300
+        for name in FLOW_ITEMS:
+            j = self._item_index[name]
+            result[:, j] = np.where(consistent, self.values[:, :4, j].sum(axis=1), np.nan)
+        return pd.DataFrame(result, index=self.tickers, columns=self.items)
+
+    def average_roc(self, years: int = 3) -> pd.Series:
+        """Mean return on capital, EBIT / (Total Assets - Current Liabilities), over the last `years` periods."""
+        capital = self.item('Total_Assets')[:, :years] - self.item('Current_Liabilities')[:, :years]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            roc = np.where(capital != 0, self.item('EBIT')[:, :years] / capital, np.nan)
+        valid = ~np.isnan(roc)
+        mean = np.where(valid.any(axis=1), np.nansum(roc, axis=1) / np.maximum(valid.sum(axis=1), 1), np.nan)
+        return pd.Series(mean, index=self.tickers)
@@ -0,0 +1,116 @@
+from typing import Iterable, Iterator, List, Optional
+import os
+import logging
+from collections.abc import Sized
+from io import StringIO
+from itertools import islice
+import pandas as pd
+import pyarrow.parquet as pq
+from bs4 import BeautifulSoup as bs
+import upstream
+
+logger = logging.getLogger(__name__)
+
+# Tickers handed to batched steps (price downloads, prefilters) at a time
+BATCH_SIZE = 250
+
+def batched(tickers: Iterable[str], size: int = BATCH_SIZE) -> Iterator[List[str]]:
+    """Group a ticker stream into lists of at most `size`."""
+    iterator = iter(tickers)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class UniverseProvider:
+    """Source of ticker symbols, streamed so work can start before the list is complete.
+
+    Subclasses implement `_tickers`; iterating a provider yields each symbol once,
+    stripped of whitespace and in source order. `size` is the number of symbols in
+    the source when the provider knows it (possibly only once iteration has
+    started), else None; it is a progress hint, not an exact count.
+    """
+
+    size: Optional[int] = None
+
+    def _tickers(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        for ticker in self._tickers():
+            ticker = str(ticker).strip()
+            if ticker and ticker not in seen:
+                seen.add(ticker)
+                yield ticker
+
+    def get_tickers(self) -> List[str]:
+        """The whole universe as a list."""
+        return list(self)
+
+class SP500Universe(UniverseProvider):
+    """S&P 500 constituents scraped from slickcharts."""
+
+    def __init__(self, url: str = 'https://www.slickcharts.com/sp500'):
+        self.url = url
+        self.headers = {'User-Agent': 'Mozilla/5.0'}
+
+    def _tickers(self) -> Iterator[str]:
+        try:
+            request = upstream.get(self.url, headers=self.headers)
+            request.raise_for_status()
+            soup = bs(request.text, "lxml")
+            stats = soup.find('table', class_='table table-hover table-borderless table-sm')
+
+            if not stats:
+                raise ValueError("Table not found in webpage")
+
+            df = pd.read_html(StringIO(str(stats)))[0]
+        except Exception as e:
+            logger.error(f"Error fetching S&P 500 tickers: {e}")
+            return
+        self.size = len(df)
+        yield from df['Symbol']
+
+class B3Universe(UniverseProvider):
+    """Brazilian listings, given as B3 codes (e.g. 'TAEE11') and served as Yahoo '.SA' symbols."""
+
+    def __init__(self, symbols: Iterable[str], suffix: str = '.SA'):
+        self.symbols = symbols
+        self.suffix = suffix
+        self.size = len(symbols) if isinstance(symbols, Sized) else None
+
+    def _tickers(self) -> Iterator[str]:
+        for symbol in self.symbols:
+            symbol = str(symbol).strip().upper()
+            yield symbol if symbol.endswith(self.suffix) else symbol + self.suffix
+
+class FileUniverse(UniverseProvider):
+    """Tickers read from one column of a CSV or Parquet file, a chunk at a time."""
+
+    def __init__(self, path: str, column: str = 'ticker', suffix: Optional[str] = None,
+                 chunksize: int = 10_000):
+        self.path = path
+        self.column = column
+        self.suffix = suffix
+        self.chunksize = chunksize
+
+    def _chunks(self) -> Iterator[List[str]]:
+        if os.path.splitext(self.path)[1].lower() in ('.parquet', '.pq'):
+            parquet = pq.ParquetFile(self.path)
+            self.size = parquet.metadata.num_rows
+            for batch in parquet.iter_batches(batch_size=self.chunksize, columns=[self.column]):
+                yield batch.column(0).to_pylist()
+        else:
+            for chunk in pd.read_csv(self.path, usecols=[self.column], dtype=str, chunksize=self.chunksize):
+                yield chunk[self.column].tolist()
+
+    def _tickers(self) -> Iterator[str]:
+        for chunk in self._chunks():
+            for ticker in chunk:
+                if ticker is None or pd.isna(ticker):
+                    continue
+                if self.suffix and not ticker.endswith(self.suffix):
+                    ticker += self.suffix
+                yield ticker
@@ -0,0 +1,188 @@
+from typing import Any, Callable, Dict, Optional
+import os
+import json
+import zlib
+import pickle
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+import requests
+import yfinance as yf
+
+logger = logging.getLogger(__name__)
+
+MODES = ('record', 'replay')
+
+# Ticker attributes that are methods; everything else is read as a property
+TICKER_METHODS = ('history', 'get_info', 'get_dividends')
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+class RecordedResponse:
+    """Minimal stand-in for `requests.Response` served from a cassette."""
+
+    def __init__(self, url: str, status_code: int, text: str):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+class Cassette:
+    """Content-addressed store of upstream responses (slickcharts HTML, Yahoo data).
+
+    Every response is pickled, compressed and stored once under the SHA-256 of its
+    bytes in `<path>/objects/`, and `<path>/index.json` maps each request key to its
+    object. Exceptions raised upstream are recorded too, so a replayed run takes
+    the same paths. Price caches should start empty when recording or replaying,
+    since incremental price downloads depend on what is already cached.
+    """
+
+    def __init__(self, path: str, mode: str = 'replay'):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.index_path = os.path.join(path, 'index.json')
+        self.objects_dir = os.path.join(path, 'objects')
+        self.index: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+        elif mode == 'replay':
+            raise FileNotFoundError(f"No cassette found at {path}")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    @staticmethod
+    def _key(parts: tuple) -> str:
+        return json.dumps(parts, sort_keys=True, default=str)
+
+    def _write_object(self, payload: Any) -> str:
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.objects_dir, f"{digest}.pkl.z")
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(zlib.compress(data, 6))
+        return digest
+
+    def _read_object(self, digest: str) -> Any:
+        with open(os.path.join(self.objects_dir, f"{digest}.pkl.z"), 'rb') as f:
+            return pickle.loads(zlib.decompress(f.read()))
+
+    def fetch(self, parts: tuple, call: Callable[[], Any]) -> Any:
+        """Serve a request from the cassette, or perform and record it.
+
+        Args:
+            parts: JSON-serializable description of the request
+            call: Function performing the real upstream request
+
+        Returns:
+            Any: The (recorded) response; recorded exceptions are re-raised
+        """
+        key = self._key(parts)
+        key_hash = hashlib.sha256(key.encode()).hexdigest()
+        if self.mode == 'replay':
+            entry = self.index.get(key_hash)
+            if entry is None:
+                raise CassetteMiss(key)
+            kind, value = self._read_object(entry['object'])
+            if kind == 'error':
+                raise value
+            return value
+
+        try:
+            payload = ('value', call())
+        except Exception as e:
+            payload = ('error', e)
+        try:
+            digest = self._write_object(payload)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            payload = ('error', RuntimeError(str(payload[1])))
+            digest = self._write_object(payload)
+
+        with self._lock:
+            self.index[key_hash] = {'key': key, 'object': digest}
+        if payload[0] == 'error':
+            raise payload[1]
+        return payload[1]
+
+    def save(self) -> None:
+        """Write the request index (record mode only)."""
+        if self.mode != 'record':
+            return
+        with self._lock:
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+        logger.info(f"Cassette {self.path} saved with {len(self.index)} requests")
+
+class TickerProxy:
+    """yfinance Ticker whose attribute reads and method calls go through a cassette."""
+
+    def __init__(self, symbol: str, cassette: Cassette):
+        self._symbol = symbol
+        self._cassette = cassette
+        self._ticker: Optional[yf.Ticker] = None
+
+    def _real(self) -> yf.Ticker:
+        if self._ticker is None:
+            self._ticker = yf.Ticker(self._symbol)
+        return self._ticker
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name in TICKER_METHODS:
+            def method(*args, **kwargs):
+                return self._cassette.fetch(
+                    ('Ticker', self._symbol, name, args, kwargs),
+                    lambda: getattr(self._real(), name)(*args, **kwargs)
+                )
+            return method
+        return self._cassette.fetch(('Ticker', self._symbol, name), lambda: getattr(self._real(), name))
+
+_active: Optional[Cassette] = None
+
+@contextmanager
+def use_cassette(path: str, mode: str = 'replay'):
+    """Record or replay every upstream call made inside the block.
+
+    Usage:
+        with use_cassette('cassettes/2026-10-18', 'record'):
+            main()
+    """
+    global _active
+    previous, _active = _active, Cassette(path, mode)
+    try:
+        yield _active
+    finally:
+        _active.save()
+        _active = previous
+
+def Ticker(symbol: str) -> Any:
+    """Drop-in for `yf.Ticker` that honours the active cassette."""
+    if _active is None:
+        return yf.Ticker(symbol)
+    return TickerProxy(symbol, _active)
+
+def download(tickers, **kwargs) -> Any:
+    """Drop-in for `yf.download` that honours the active cassette."""
+    if _active is None:
+        return yf.download(tickers, **kwargs)
+    return _active.fetch(('download', tickers, kwargs), lambda: yf.download(tickers, **kwargs))
+
+def get(url: str, **kwargs) -> Any:
+    """Drop-in for `requests.get` that honours the active cassette."""
+    if _active is None:
+        return requests.get(url, **kwargs)
+
+    def call() -> RecordedResponse:
+        response = requests.get(url, **kwargs)
+        return RecordedResponse(url, response.status_code, response.text)
+    return _active.fetch(('get', url, kwargs.get('params')), call)
@@ -0,0 +1,220 @@
+from typing import List, Dict, Optional
+import logging
+import numpy as np
+import pandas as pd
+from market_data import PriceMatrixCache
+
+logger = logging.getLogger(__name__)
+
+WEIGHTING_METHODS = ('equal', 'inverse_vol', 'risk_parity', 'min_variance')
+
+class RollingCovariance:
+    """Rolling-window covariance maintained from running sums.
+
+    Keeps the last `window` return rows in a ring buffer together with pairwise
+    observation counts, sums and the cross-product matrix, so adding a day costs
+    O(N^2) instead of a full O(T * N^2) recomputation. Moments are pairwise
+    complete: each pair uses only the days on which both names have a return, so
+    a short history is never padded with zero returns.
+    """
+
+    def __init__(self, returns: pd.DataFrame, window: int = 252, refresh_every: int = 500):
+        self.tickers = list(returns.columns)
+        self.window = window
+        self.refresh_every = refresh_every
+        self._index = {t: i for i, t in enumerate(self.tickers)}
+
+        data = returns.to_numpy(dtype=float)[-window:]
+        self.buffer = np.zeros((window, len(self.tickers)))
+        self.observed = np.zeros((window, len(self.tickers)))
+        self.count = len(data)
+        self.buffer[:self.count] = np.nan_to_num(data)
+        self.observed[:self.count] = ~np.isnan(data)
+        self.head = self.count % window
+        self._rebuild_sums()
+
+    def _rebuild_sums(self) -> None:
+        """Recompute running sums from the buffer to clear accumulated rounding."""
+        rows, observed = self.buffer[:self.count], self.observed[:self.count]
+        # pairs[i, j]: days both have a return; sum[i, j]: sum of i's returns on those days
+        self.pairs = observed.T @ observed
+        self.sum = rows.T @ observed
+        self.cross = rows.T @ rows
+        self.updates = 0
+
+    def push(self, row: np.ndarray) -> None:
+        """Add one day of returns, dropping the oldest day once the window is full."""
+        row = np.asarray(row, dtype=float)
+        observed = (~np.isnan(row)).astype(float)
+        row = np.nan_to_num(row)
+        if self.count == self.window:
+            old, old_observed = self.buffer[self.head], self.observed[self.head]
+            self.pairs -= np.outer(old_observed, old_observed)
+            self.sum -= np.outer(old, old_observed)
+            self.cross -= np.outer(old, old)
+        else:
+            self.count += 1
+
+        self.buffer[self.head] = row
+        self.observed[self.head] = observed
+        self.head = (self.head + 1) % self.window
+        self.pairs += np.outer(observed, observed)
+        self.sum += np.outer(row, observed)
+        self.cross += np.outer(row, row)
+
+        self.updates += 1
+        if self.updates >= self.refresh_every:
+            self._rebuild_sums()
+
+    def tracks(self, tickers: List[str]) -> bool:
+        """Whether every ticker is part of the estimated universe."""
+        return all(t in self._index for t in tickers)
+
+    def observations(self, tickers: List[str]) -> np.ndarray:
+        """Number of days in the window with a return, per ticker."""
+        idx = np.array([self._index[t] for t in tickers], dtype=int)
+        return np.diag(self.pairs)[idx].astype(int)
+
+    def covariance(self, tickers: Optional[List[str]] = None, shrink: bool = True) -> np.ndarray:
+        """Covariance matrix for a subset of tickers, Ledoit-Wolf shrunk by default.
+
+        Args:
+            tickers: Symbols to include (all tracked symbols by default)
+            shrink: Shrink towards a scaled identity with the Ledoit-Wolf intensity
+
+        Returns:
+            np.ndarray: Covariance matrix in the order of `tickers`; pairs with fewer
+            than two common days get zero covariance
+        """
+        if self.count < 2:
+            raise ValueError("Not enough observations to estimate covariance")
+
+        idx = np.arange(len(self.tickers)) if tickers is None else np.array([self._index[t] for t in tickers])
+        ix = np.ix_(idx, idx)
+        pairs, sums = self.pairs[ix], self.sum[ix]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sample = self.cross[ix] / pairs - (sums / pairs) * (sums.T / pairs)
+            unbiased = sample * pairs / (pairs - 1)
+        sample = np.where(pairs >= 2, sample, 0.0)
+        if not shrink:
+            return np.where(pairs >= 2, unbiased, 0.0)
+
+        # Ledoit-Wolf (2004) intensity: sum_t ||y_t y_t' - S||^2 = sum_t ||y_t||^4 - n ||S||^2,
+        # with missing returns contributing nothing to the centered rows
+        n = self.count
+        observed = self.observed[:n, idx]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nan_to_num(np.diag(sums) / np.diag(pairs))
+        centered = (self.buffer[:n, idx] - mean) * observed
+        sq_norms = np.einsum('ij,ij->i', centered, centered)
+        k = len(idx)
+        mu = np.trace(sample) / k
+        delta = ((sample - mu * np.eye(k)) ** 2).sum() / k
+        beta = ((sq_norms ** 2).sum() / n - (sample ** 2).sum()) / (n * k)
+        intensity = 0.0 if delta == 0 else min(max(beta, 0.0), delta) / delta
+        return intensity * mu * np.eye(k) + (1 - intensity) * sample
+
+class PortfolioWeighter:
+    """Position sizing for the top-10 lists produced by the Carteira scripts.
+
+    Names with fewer than `min_periods` returns in the window (recent listings) get
+    an equal-weight slot instead of a risk-based one, since their volatility
+    estimate is unreliable; the other names share the rest by the chosen method.
+    """
+
+    def __init__(self, cache: Optional[PriceMatrixCache] = None, window: int = 252, min_periods: int = 63):
+        self.cache = cache or PriceMatrixCache()
+        self.window = window
+        self.min_periods = min_periods
+        self.estimator: Optional[RollingCovariance] = None
+
+    def refresh(self, tickers: List[str]) -> None:
+        """Update cached prices and roll the covariance forward by the new days only."""
+        new_returns = self.cache.update(tickers)
+        if self.estimator is None or not self.estimator.tracks(tickers):
+            self.estimator = RollingCovariance(self.cache.returns(), self.window)
+            return
+
+        for row in new_returns.reindex(columns=self.estimator.tickers).to_numpy():
+            self.estimator.push(row)
+
+    def weights(self, tickers: List[str], method: str = 'equal') -> pd.Series:
+        """Compute portfolio weights for the given tickers.
+
+        Args:
+            tickers: Portfolio constituents
+            method: One of 'equal', 'inverse_vol', 'risk_parity', 'min_variance'
+
+        Returns:
+            pd.Series: Weights summing to one, indexed by ticker
+        """
+        if method not in WEIGHTING_METHODS:
+            raise ValueError(f"Unknown weighting method: {method}")
+        if method == 'equal':
+            return pd.Series(1.0 / len(tickers), index=tickers)
+
+        if self.estimator is None or not self.estimator.tracks(tickers):
+            self.refresh(tickers)
+        short = self.estimator.observations(tickers) < self.min_periods
+        if short.any():
+            logger.warning(f"Less than {self.min_periods} days of returns for "
+                           f"{', '.join(np.array(tickers)[short])}; equal-weighting them")
+        weights = pd.Series(1.0 / len(tickers), index=tickers)
+        estimated = [t for t, s in zip(tickers, short) if not s]
+        if not estimated:
+            return weights
+        cov = self.estimator.covariance(estimated)
+
+        if method == 'inverse_vol':
+            raw = 1.0 / np.sqrt(np.diag(cov))
+        elif method == 'risk_parity':
+            raw = risk_parity(cov)
+        else:
+            raw = min_variance(cov)
+        weights[estimated] = raw / raw.sum() * len(estimated) / len(tickers)
+        return weights
+
+    def weigh_portfolios(self, portfolios: Dict[str, List[str]], method: str = 'equal') -> Dict[str, pd.Series]:
+        """Weight several portfolios against one shared covariance estimate."""
+        self.refresh(sorted({t for tickers in portfolios.values() for t in tickers}))
+        return {name: self.weights(tickers, method) for name, tickers in portfolios.items()}
+
+def risk_parity(cov: np.ndarray, tol: float = 1e-10, max_iter: int = 50) -> np.ndarray:
+    """Equal-risk-contribution weights via Newton's method on Spinu's convex objective.
+
+    Minimizes 0.5 x'Cx - sum(log x) / n, whose optimum has equal risk contributions.
+    """
+    n = len(cov)
+    budget = np.full(n, 1.0 / n)
+    x = 1.0 / np.sqrt(np.diag(cov))
+    x /= np.sqrt(x @ cov @ x)
+
+    for _ in range(max_iter):
+        grad = cov @ x - budget / x
+        if np.abs(grad).max() < tol:
+            break
+        step = np.linalg.solve(cov + np.diag(budget / x ** 2), grad)
+        # Damp the step so every weight stays strictly positive
+        scale = 1.0
+        while np.any(x - scale * step <= 0):
+            scale /= 2
+        x = x - scale * step
+
+    return x / x.sum()
+
+def min_variance(cov: np.ndarray, long_only: bool = True) -> np.ndarray:
+    """Minimum-variance weights; long-only by re-solving without negative names."""
+    n = len(cov)
+    active = np.ones(n, dtype=bool)
+    weights = np.zeros(n)
+
+    while active.any():
+        sub = cov[np.ix_(active, active)]
+        raw = np.linalg.solve(sub, np.ones(active.sum()))
+        weights[:] = 0.0
+        weights[active] = raw / raw.sum()
+        if not long_only or (weights >= 0).all():
+            break
+        active &= weights > 0
+
+    return weights
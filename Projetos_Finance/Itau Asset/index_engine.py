@@ -0,0 +1,210 @@
+from typing import Dict, Iterable, Optional, Sequence
+import logging
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+WEIGHTINGS = ('free_float', 'equal')
+
+# B3 rebalances SMAL every four months, with new portfolios in January, May and September
+SMAL_MONTHS = (1, 5, 9)
+
+@dataclass
+class IndexRules:
+    """Methodology of a theoretical index portfolio."""
+    weighting: str = 'free_float'
+    max_weight: Optional[float] = 0.20
+    base_level: float = 1000.0
+
+@dataclass
+class IndexResult:
+    """Data class to store a computed index history."""
+    level: pd.Series
+    divisor: pd.Series
+    weights: pd.DataFrame
+    quantities: pd.DataFrame
+
+def rebalance_calendar(dates: pd.DatetimeIndex, months: Sequence[int] = SMAL_MONTHS) -> pd.DatetimeIndex:
+    """Last trading day before each new portfolio month starts.
+
+    The new composition takes effect from the first trading day of each of `months`,
+    so it is set at the close of the trading day before.
+    """
+    dates = pd.DatetimeIndex(dates).sort_values()
+    periods = dates.to_period('M')
+    first_of_month = np.r_[True, periods[1:] != periods[:-1]]
+    starts = np.flatnonzero(first_of_month & np.isin(dates.month, months))
+    return dates[starts[starts > 0] - 1]
+
+def composition_from_lists(constituents: Dict[pd.Timestamp, Iterable[str]],
+                           shares: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Rebalance date x ticker matrix of free-float shares from constituent lists.
+
+    Args:
+        constituents: Constituents by rebalance date
+        shares: Date x ticker free-float share counts, taken as of each rebalance date;
+            every constituent counts as one share when omitted (equal weighting input)
+
+    Returns:
+        pd.DataFrame: Free-float shares per constituent, NaN for non-constituents
+    """
+    dates = pd.DatetimeIndex(sorted(constituents))
+    tickers = sorted({t for members in constituents.values() for t in members})
+    member = pd.DataFrame(False, index=dates, columns=tickers)
+    for date, members in constituents.items():
+        member.loc[pd.Timestamp(date), list(members)] = True
+
+    if shares is None:
+        counts = pd.DataFrame(1.0, index=dates, columns=tickers)
+    else:
+        counts = shares.sort_index().reindex(columns=tickers).ffill()
+        counts = counts.reindex(counts.index.union(dates)).ffill().reindex(dates)
+    return counts.where(member)
+
+def cap_weights(weights: np.ndarray, max_weight: float, max_iterations: int = 100) -> np.ndarray:
+    """Cap every row's weights at `max_weight`, redistributing the excess pro rata.
+
+    All rows are processed together; each pass caps the names over the limit and
+    scales the uncapped ones, until no weight exceeds the cap.
+    """
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    if weights.ndim == 1:
+        return cap_weights(weights[None], max_weight, max_iterations)[0]
+    counts = (weights > 0).sum(axis=1)
+    if np.any(counts * max_weight < 1 - 1e-12):
+        logger.warning(f"Some rebalances have too few names for a {max_weight:.0%} cap; their weights stay above it")
+
+    capped = np.zeros(weights.shape, dtype=bool)
+    for _ in range(max_iterations):
+        over = weights > max_weight + 1e-12
+        if not over.any():
+            break
+        capped |= over
+        free = np.where(capped, 0.0, weights)
+        room = 1 - max_weight * capped.sum(axis=1, keepdims=True)
+        total_free = free.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scaled = free * np.where(total_free > 0, np.maximum(room, 0) / total_free, 0.0)
+        weights = np.where(capped, max_weight, scaled)
+    return weights
+
+class IndexEngine:
+    """Daily levels, divisors and weights of a theoretical index over a price matrix.
+
+    At each rebalance close the target weights (free-float cap or equal, capped at
+    `max_weight`) are converted into theoretical quantities, and the divisor is
+    adjusted so the level is continuous through the rebalance. Between rebalances
+    the quantities are fixed, so every level is one weighted sum over the date x
+    ticker matrix and the divisors are a cumulative product over rebalance dates.
+    Missing closes carry the last price (suspended or delisted names keep their
+    last value until the next rebalance).
+    """
+
+    def __init__(self, prices: pd.DataFrame, rules: Optional[IndexRules] = None):
+        self.prices = prices.sort_index()
+        self.rules = rules or IndexRules()
+        if self.rules.weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown weighting: {self.rules.weighting}")
+
+    def target_weights(self, composition: pd.DataFrame) -> pd.DataFrame:
+        """Capped target weights at each rebalance date."""
+        prices = self.prices.reindex(columns=composition.columns).ffill()
+        closes = prices.reindex(prices.index.union(composition.index)).ffill().reindex(composition.index)
+        member = composition.notna() & (composition > 0) & closes.notna()
+
+        if self.rules.weighting == 'free_float':
+            raw = (composition * closes).where(member, 0.0).to_numpy(dtype=float)
+        else:
+            raw = member.to_numpy(dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weights = raw / raw.sum(axis=1, keepdims=True)
+        if self.rules.max_weight is not None:
+            weights = cap_weights(weights, self.rules.max_weight)
+        return pd.DataFrame(np.nan_to_num(weights), index=composition.index, columns=composition.columns)
+
+    def compute(self, composition: pd.DataFrame) -> IndexResult:
+        """Compute the index history.
+
+        Args:
+            composition: Rebalance date x ticker free-float shares (NaN for
+                non-constituents), e.g. from `composition_from_lists`. Each row is
+                applied at the close of its date
+
+        Returns:
+            IndexResult: Level and divisor per date, constituent weights and
+            theoretical quantities per date and ticker (NaN before the first rebalance)
+        """
+        prices = self.prices.reindex(columns=composition.columns).ffill()
+        dates = prices.index
+        composition = composition.sort_index()
+        composition = composition[(composition.index >= dates[0]) & (composition.index <= dates[-1])]
+        if composition.empty:
+            raise ValueError("No rebalance date falls within the price history")
+
+        # Rebalances on non-trading days apply at the previous close
+        rebalance_pos = dates.searchsorted(composition.index, side='right') - 1
+        rebalances = dates[rebalance_pos]
+        weights = self.target_weights(composition.set_axis(rebalances)).to_numpy()
+        values = prices.to_numpy(dtype=float)
+        close = np.nan_to_num(values[rebalance_pos])
+
+        # Quantities that hold each weight of one unit of value at the rebalance close
+        with np.errstate(invalid='ignore', divide='ignore'):
+            quantities = np.where(close > 0, weights / close, 0.0)
+
+        # Value of the new and the outgoing portfolio at each rebalance close
+        new_value = np.sum(quantities * close, axis=1)
+        old_value = np.r_[np.nan, np.sum(quantities[:-1] * close[1:], axis=1)]
+        ratio = np.where(np.arange(len(rebalances)) == 0, new_value / self.rules.base_level, new_value / old_value)
+        divisors = np.cumprod(ratio)
+
+        # Each date uses the last composition set strictly before it
+        segment = np.searchsorted(rebalance_pos, np.arange(len(dates)), side='left') - 1
+        active = segment >= 0
+        daily_q = np.zeros(values.shape)
+        daily_q[active] = quantities[segment[active]]
+        holdings = daily_q * np.nan_to_num(values)
+        numerator = holdings.sum(axis=1)
+
+        level = np.full(len(dates), np.nan)
+        divisor = np.full(len(dates), np.nan)
+        level[active] = numerator[active] / divisors[segment[active]]
+        divisor[active] = divisors[segment[active]]
+        # The first rebalance close is the base date
+        level[rebalance_pos[0]] = self.rules.base_level
+        divisor[rebalance_pos[0]] = divisors[0]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            daily_weights = holdings / numerator[:, None]
+        daily_weights[~active] = np.nan
+        daily_q[~active] = np.nan
+
+        return IndexResult(
+            level=pd.Series(level, index=dates, name='level'),
+            divisor=pd.Series(divisor, index=dates, name='divisor'),
+            weights=pd.DataFrame(daily_weights, index=dates, columns=prices.columns),
+            quantities=pd.DataFrame(daily_q, index=dates, columns=prices.columns)
+        )
+
+def tracking_error(level: pd.Series, published: pd.Series, periods_per_year: int = 252) -> pd.Series:
+    """Compare a replicated index with the published one over their common dates.
+
+    Returns:
+        pd.Series: Annualized tracking error and active return, daily return
+        correlation, largest daily return gap and number of days compared
+    """
+    common = level.dropna().index.intersection(published.dropna().index)
+    ours = level.reindex(common).pct_change().iloc[1:]
+    theirs = published.reindex(common).pct_change().iloc[1:]
+    active = ours - theirs
+    report = pd.Series({
+        'tracking_error': active.std() * np.sqrt(periods_per_year),
+        'active_return': active.mean() * periods_per_year,
+        'correlation': ours.corr(theirs),
+        'max_daily_gap': active.abs().max(),
+        'days': len(active),
+    })
+    logger.info(f"\nTracking vs published index:\n{report.round(6).to_string()}")
+    return report
@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional, Union
+import os
+import json
+import shutil
+import hashlib
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Reference inputs kept next to this module
+WORKBOOKS = {
+    'fundamentos': os.path.join(HERE, 'Fundamentos Ações.xlsx'),
+    'racional': os.path.join(HERE, 'Racional_indices.xlsx'),
+}
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _typed(sheet: pd.DataFrame) -> pd.DataFrame:
+    """Give every column a single Parquet type.
+
+    Excel columns often mix numbers with placeholders such as '-' or 'N/A'. Columns
+    whose cells are all numbers or placeholders become floats (placeholders become
+    NaN); any other column is stored as strings.
+    """
+    sheet = sheet.copy()
+    sheet.columns = [str(c) for c in sheet.columns]
+    for column in sheet.columns:
+        values = sheet[column]
+        if values.dtype != object:
+            continue
+        numeric = pd.to_numeric(values, errors='coerce')
+        placeholders = values.isna() | values.astype(str).str.strip().isin(['', '-', '--', 'N/A', 'n/a', '#N/A'])
+        if numeric.notna().any() and (numeric.notna() | placeholders).all():
+            sheet[column] = numeric.astype(float)
+        else:
+            sheet[column] = values.map(lambda v: None if pd.isna(v) else str(v))
+    return sheet
+
+class WorkbookCache:
+    """Columnar Parquet copies of Excel workbooks, keyed by the workbook's hash.
+
+    The first read of a workbook parses every sheet once through `pd.read_excel`
+    and writes each as a typed Parquet file under
+    `<cache_dir>/<workbook>-<hash>/`. Later reads load only the requested columns
+    from the memory-mapped Parquet copy. A changed workbook gets a new hash, so its
+    copy is rebuilt and the stale one removed; size and modification time are
+    checked first so unchanged workbooks are not re-hashed on every read.
+    """
+
+    def __init__(self, cache_dir: str = os.path.join(HERE, 'cache', 'workbooks')):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.manifest: Dict[str, Dict] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1, ensure_ascii=False)
+
+    @staticmethod
+    def _resolve(workbook: str) -> str:
+        return os.path.abspath(WORKBOOKS.get(workbook, workbook))
+
+    def _entry(self, path: str) -> Dict:
+        """Manifest entry of a workbook, converting it if it is new or changed."""
+        stat = os.stat(path)
+        entry = self.manifest.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry
+
+        digest = file_digest(path)
+        if entry and entry['digest'] == digest and os.path.isdir(entry['directory']):
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            self._save_manifest()
+            return entry
+
+        if entry:
+            shutil.rmtree(entry['directory'], ignore_errors=True)
+            logger.info(f"{os.path.basename(path)} changed, rebuilding its Parquet copy")
+        entry = self._convert(path, digest)
+        entry.update(size=stat.st_size, mtime=stat.st_mtime)
+        self.manifest[path] = entry
+        self._save_manifest()
+        return entry
+
+    def _convert(self, path: str, digest: str) -> Dict:
+        """Parse every sheet once and write it as Parquet."""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        directory = os.path.join(self.cache_dir, f"{stem}-{digest[:16]}")
+        os.makedirs(directory, exist_ok=True)
+
+        sheets = pd.read_excel(path, sheet_name=None)
+        files = {}
+        for position, (name, sheet) in enumerate(sheets.items()):
+            file = os.path.join(directory, f"{position:02d}.parquet")
+            pq.write_table(pa.Table.from_pandas(_typed(sheet), preserve_index=False), file, compression='zstd')
+            files[name] = file
+        logger.info(f"Converted {len(files)} sheets of {os.path.basename(path)} to Parquet")
+        return {'digest': digest, 'directory': directory, 'sheets': files}
+
+    def sheets(self, workbook: str) -> List[str]:
+        """Sheet names of a workbook, in workbook order."""
+        return list(self._entry(self._resolve(workbook))['sheets'])
+
+    def read(self, workbook: str, sheet: Union[str, int] = 0,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read one sheet from the Parquet copy.
+
+        Args:
+            workbook: Key of WORKBOOKS (e.g. 'fundamentos') or a path to an .xlsx file
+            sheet: Sheet name or position
+            columns: Columns to load (all by default); names are stored as strings
+
+        Returns:
+            pd.DataFrame: The sheet with one type per column
+        """
+        files = self._entry(self._resolve(workbook))['sheets']
+        name = list(files)[sheet] if isinstance(sheet, int) else sheet
+        if name not in files:
+            raise KeyError(f"Sheet {name!r} not found; available: {list(files)}")
+        return pq.read_table(files[name], columns=columns, memory_map=True).to_pandas()
+
+    def read_all(self, workbook: str) -> Dict[str, pd.DataFrame]:
+        """Every sheet of a workbook, by name (like `pd.read_excel(sheet_name=None)`)."""
+        return {name: self.read(workbook, name) for name in self.sheets(workbook)}
+
+_default: Optional[WorkbookCache] = None
+
+def read_workbook(workbook: str, sheet: Union[str, int] = 0, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Drop-in for `pd.read_excel(workbook, sheet_name=sheet, usecols=columns)` served from the Parquet cache."""
+    global _default
+    if _default is None:
+        _default = WorkbookCache()
+    return _default.read(workbook, sheet, columns)